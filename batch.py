@@ -0,0 +1,173 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+from handler import metricsHandler
+
+def read_targets(filename):
+    """
+    Read the targets from a file with one target per line, - reads stdin.
+    Empty lines and comments starting with # are ignored.
+    """
+    if filename == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(filename, "r", encoding="utf8") as targets_file:
+            lines = targets_file.readlines()
+
+    targets = []
+    for line in lines:
+        line = line.split("#")[0].strip()
+        if line:
+            targets.extend(line.split())
+
+    return targets
+
+def write_textfile(output_dir, target, text):
+    """
+    Atomically write the metrics of the target to a textfile collector file.
+    """
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", target)
+    filename = os.path.join(output_dir, f"redfish_{name}.prom")
+
+    # the textfile collector ignores files without the .prom extension
+    fd, tmp_filename = tempfile.mkstemp(dir=output_dir, prefix=f".redfish_{name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(text)
+        os.chmod(tmp_filename, 0o644)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.unlink(tmp_filename)
+        raise
+
+    return filename
+
+class ExpositionMerger(object):
+    """
+    Merge the exposition texts of several targets into one, with the samples
+    of every metric family under a single HELP and TYPE header. The families
+    keep the order in which they first appear.
+
+    The samples of a family are appended to a spool file as every target is
+    added, which keeps them in memory up to spool_size bytes and moves them to
+    a temporary file after that, so the memory of a batch does not grow with
+    the number of targets.
+    """
+
+    def __init__(self, spool_size=64 * 1024):
+        self.spool_size = spool_size
+        self.families = OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, text):
+        samples = None
+        new = False
+        for line in text.splitlines(keepends=True):
+            if line.startswith((b"# HELP ", b"# TYPE ")):
+                name = line.split(b" ", 3)[2]
+                if name not in self.families:
+                    self.families[name] = ([], tempfile.SpooledTemporaryFile(max_size=self.spool_size))
+                    new = True
+                elif line.startswith(b"# HELP "):
+                    new = False
+
+                headers, samples = self.families[name]
+                if new:
+                    headers.append(line)
+
+            elif samples is not None:
+                samples.write(line)
+
+    def write(self, stream):
+        """
+        Write the merged families to the binary stream.
+        """
+        for headers, samples in self.families.values():
+            stream.write(b"".join(headers))
+            samples.seek(0)
+            shutil.copyfileobj(samples, stream)
+
+    def close(self):
+        for _, samples in self.families.values():
+            samples.close()
+        self.families.clear()
+
+class BatchCollector(object):
+    """
+    Collect the metrics of many targets concurrently, limited by a global
+    number of workers.
+    """
+
+    def __init__(self, config, metrics_type, workers):
+        self.workers = max(1, int(workers))
+        self._handler = metricsHandler(config, metrics_type)
+
+    def _collect(self, target):
+        start_time = time.time()
+        try:
+            return target, self._handler.collect(target), None, time.time() - start_time
+        except Exception as err:
+            return target, None, err, time.time() - start_time
+
+    def collect(self, targets):
+        """
+        Yield (target, text, error, duration) in the order the targets finish.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as executor:
+            futures = [executor.submit(self._collect, target) for target in targets]
+            for future in as_completed(futures):
+                yield future.result()
+
+        self._handler.stop()
+
+def run_batch(config, targets, workers, output_dir=None, metrics_type="health"):
+    """
+    Collect all targets, write the merged output to stdout or one .prom file
+    per target into output_dir. Returns the exit code.
+    """
+    targets = list(dict.fromkeys(targets))
+    if not targets:
+        logging.error("No targets given for the batch collection!")
+        return 1
+
+    logging.info("Collecting %s metrics of %s targets with %s workers", metrics_type, len(targets), workers)
+    start_time = time.time()
+    failed = 0
+
+    with ExpositionMerger() as merger:
+        for target, text, error, duration in BatchCollector(config, metrics_type, workers).collect(targets):
+            if error:
+                failed += 1
+                logging.error("Target %s: Batch collection failed: %s", target, error)
+                continue
+
+            logging.debug("Target %s: Collected in %.2f seconds", target, duration)
+            if output_dir:
+                write_textfile(output_dir, target, text)
+            else:
+                merger.add(text)
+
+        if not output_dir:
+            merger.write(sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+
+    logging.info(
+        "Collected %s of %s targets in %.2f seconds",
+        len(targets) - failed, len(targets), time.time() - start_time
+    )
+
+    return 1 if failed == len(targets) else 0
@@ -0,0 +1,93 @@
+"""
+Microbenchmark of the JSON decoding of Redfish responses.
+
+Decodes recorded Redfish payloads, the *.json files of a directory, with the
+available parsers of json_decoder and compares them to json.loads with
+encoding detection, which requests uses for Response.json(). Without a
+directory it uses generated drive and collection payloads.
+
+    python benchmarks/json_decoding.py [--payloads DIR] [--number N]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from json_decoder import PARSERS, RESOURCE_FIELDS, JSONDecoder
+from resources import resource_kind
+
+def generated_payloads(drives=64):
+    payloads = []
+    members = []
+    for index in range(drives):
+        url = f"/redfish/v1/Chassis/1/Drives/d{index}"
+        members.append({"@odata.id": url})
+        smart_data = {f"Device [nvme{index}n1] Attribute {attribute}": str(attribute * 7) for attribute in range(40)}
+        smart_data.update({
+            "Temperature": "35 Celsius",
+            "Power On Hours": str(1000 + index),
+            "Percentage Used": "2%",
+        })
+        payloads.append((url, json.dumps({
+            "@odata.id": url,
+            "@odata.type": "#Drive.v1_9_0.Drive",
+            "Id": f"SER{index}",
+            "Model": "ModelX",
+            "MediaType": "NVMe",
+            "CapacityBytes": 3840755982336,
+            "Status": {"State": "Enabled", "Health": "OK"},
+            "Links": {"Volumes": [{"@odata.id": f"/redfish/v1/Systems/1/Storage/1/Volumes/{index}"}]},
+            "Oem": {"SmartData": smart_data, "Vendor": {"Log": ["entry %d" % line for line in range(50)]}},
+        }).encode("utf-8")))
+
+    payloads.append(("/redfish/v1/Chassis/1/Drives", json.dumps({"Members": members}).encode("utf-8")))
+    return payloads
+
+def recorded_payloads(directory):
+    payloads = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path, "rb") as payload_file:
+            body = payload_file.read()
+        # a recorded resource carries its URL in @odata.id
+        url = json.loads(body).get("@odata.id", "") if body.lstrip().startswith(b"{") else ""
+        payloads.append((url, body))
+
+    return payloads
+
+def run(name, decode, payloads, number, baseline=None):
+    seconds = min(timeit.repeat(lambda: [decode(url, body) for url, body in payloads], number=number, repeat=3))
+    per_payload = seconds / number / len(payloads) * 1e6
+    print(f"{name:<24} {per_payload:10.1f} us/payload {(baseline or per_payload) / per_payload:8.2f}x")
+    return per_payload
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--payloads", help="Directory of recorded Redfish payloads", metavar="DIR")
+    parser.add_argument("--number", help="Decoding rounds per measurement", type=int, default=50)
+    args = parser.parse_args()
+
+    payloads = recorded_payloads(args.payloads) if args.payloads else generated_payloads()
+    if not payloads:
+        sys.exit(f"No *.json payloads in {args.payloads}")
+
+    size = sum(len(body) for url, body in payloads)
+    print(f"{len(payloads)} payloads, {size / len(payloads):.0f} bytes on average\n")
+
+    baseline = run("json (detect encoding)", lambda url, body: json.loads(body), payloads, args.number)
+    for parser_name in PARSERS:
+        decoder = JSONDecoder(parser_name, RESOURCE_FIELDS)
+        run(parser_name, lambda url, body: decoder.decode(body), payloads, args.number, baseline)
+        run(
+            f"{parser_name} + select",
+            lambda url, body: decoder.select(resource_kind(url), decoder.decode(body)),
+            payloads,
+            args.number,
+            baseline
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+"""
+Simulated Redfish BMC for benchmarks.
+
+Serves the service root, SessionService and the storage tree the exporter
+walks (StorageServices, StoragePools, CapacitySources, ProvidingDrives and
+the drives) over HTTPS with a self-signed certificate. Latency, errors and
+hanging requests can be injected. With --expand the BMC announces and
+answers the $expand and $select query parameters.
+
+    python benchmarks/mock_bmc.py --port 8443 --drives 6 --latency 0.02
+
+The server listens on all addresses, so 127.0.0.1, 127.0.0.2, ... can be
+scraped as different targets. GET /mock/stats returns the request counts
+and POST /mock/reset clears them.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from OpenSSL import crypto
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import ssl
+import tempfile
+import threading
+import time
+import urllib.parse
+
+ROOT = "/redfish/v1"
+
+def build_tree(storage_services, pools, capacity_sources, drives):
+    """
+    Return the Redfish resources by path, with drives drives per capacity source.
+    """
+    tree = {}
+    tree[ROOT] = {
+        "@odata.id": ROOT,
+        "@odata.type": "#ServiceRoot.v1_11_0.ServiceRoot",
+        "Id": "RootService",
+        "RedfishVersion": "1.11.0",
+        "SessionService": {"@odata.id": f"{ROOT}/SessionService"},
+        "StorageServices": {"@odata.id": f"{ROOT}/StorageServices"},
+    }
+    tree[f"{ROOT}/SessionService"] = {
+        "@odata.id": f"{ROOT}/SessionService",
+        "Sessions": {"@odata.id": f"{ROOT}/SessionService/Sessions"},
+    }
+
+    drive_index = itertools.count()
+    service_members = []
+    for service in range(storage_services):
+        service_url = f"{ROOT}/StorageServices/S{service}"
+        service_members.append({"@odata.id": service_url})
+        tree[service_url] = {
+            "@odata.id": service_url,
+            "Id": f"S{service}",
+            "StoragePools": {"@odata.id": f"{service_url}/StoragePools"},
+        }
+
+        pool_members = []
+        for pool in range(pools):
+            pool_url = f"{service_url}/StoragePools/P{pool}"
+            pool_members.append({"@odata.id": pool_url})
+            tree[pool_url] = {
+                "@odata.id": pool_url,
+                "Id": f"P{pool}",
+                "CapacitySources": {"@odata.id": f"{pool_url}/CapacitySources"},
+            }
+
+            source_members = []
+            for source in range(capacity_sources):
+                source_url = f"{pool_url}/CapacitySources/C{source}"
+                source_members.append({"@odata.id": source_url})
+                tree[source_url] = {
+                    "@odata.id": source_url,
+                    "Id": f"C{source}",
+                    "ProvidingDrives": {"@odata.id": f"{source_url}/ProvidingDrives"},
+                }
+
+                drive_members = []
+                for _ in range(drives):
+                    index = next(drive_index)
+                    drive_url = f"{ROOT}/Chassis/1/Drives/D{index}"
+                    drive_members.append({"@odata.id": drive_url})
+                    tree[drive_url] = build_drive(drive_url, index)
+
+                tree[f"{source_url}/ProvidingDrives"] = collection(f"{source_url}/ProvidingDrives", drive_members)
+            tree[f"{pool_url}/CapacitySources"] = collection(f"{pool_url}/CapacitySources", source_members)
+        tree[f"{service_url}/StoragePools"] = collection(f"{service_url}/StoragePools", pool_members)
+    tree[f"{ROOT}/StorageServices"] = collection(f"{ROOT}/StorageServices", service_members)
+
+    return tree
+
+def expand(tree, resource, mode, levels, depth=0):
+    """
+    Return the resource with the links expanded up to levels deep, mode * expands
+    all links and . only the ones to subordinate resources.
+    """
+    def expanded(value):
+        if isinstance(value, list):
+            return [expanded(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+
+        link = value.get("@odata.id")
+        if len(value) == 1 and link in tree and depth < levels:
+            if mode == "*" or link.startswith(resource["@odata.id"] + "/"):
+                return expand(tree, tree[link], mode, levels, depth + 1)
+            return value
+
+        return {name: expanded(item) for name, item in value.items()}
+
+    return {name: expanded(value) for name, value in resource.items()}
+
+def select(resource, paths):
+    """
+    Return the resource and the resources expanded into it with only the
+    selected properties, e.g. Members or Oem/SmartData.
+    """
+    if isinstance(resource, list):
+        return [select(item, paths) for item in resource]
+    if not isinstance(resource, dict) or "@odata.id" not in resource or len(resource) == 1:
+        return resource
+
+    selected = {"@odata.id": resource["@odata.id"]}
+    for path in paths:
+        name, _, nested = path.partition("/")
+        if name not in resource:
+            continue
+        value = select(resource[name], paths)
+        if nested and isinstance(value, dict):
+            value = {key: item for key, item in value.items() if key == nested.split("/")[0]}
+        selected[name] = value
+
+    return selected
+
+def collection(url, members):
+    return {"@odata.id": url, "Members@odata.count": len(members), "Members": members}
+
+def build_drive(url, index):
+    if index % 2 == 0:
+        media_type = "NVMe"
+        smart_data = {
+            f"SMART/Health Information (NVMe Log 0x02) [nvme{index}n1]": "",
+            "Critical Warning": "0x00",
+            "Temperature": f"{30 + index % 20} Celsius",
+            "Available Spare": "100%",
+            "Available Spare Threshold": "10%",
+            "Percentage Used": f"{index % 7}%",
+            "Data Units Read": str(123456 + index),
+            "Data Units Written": str(654321 + index),
+            "Host Read Commands": str(9876543 + index),
+            "Host Write Commands": str(3456789 + index),
+            "Controller Busy Time": str(100 + index),
+            "Power Cycles": str(40 + index),
+            "Power On Hours": str(10000 + index),
+            "Unsafe Shutdowns": str(index % 5),
+            "Media and Data Integrity Errors": "0",
+            "Error Information Log Entries": str(index % 3),
+            "Firmware Version": "1.2.3",
+        }
+    else:
+        media_type = "SAS"
+        smart_data = {
+            f"Device [sd{index}]": "",
+            "Current Drive Temperature": f"{30 + index % 20} C",
+            "Accumulated start-stop cycles": str(20 + index),
+            "Accumulated power on hours": str(20000 + index),
+            "Percentage used endurance indicator": str(index % 7),
+            "Elements in grown defect list": str(index % 4),
+        }
+
+    return {
+        "@odata.id": url,
+        "@odata.type": "#Drive.v1_9_0.Drive",
+        "Id": f"SN{index:08d}",
+        "Model": "Mock Drive",
+        "MediaType": media_type,
+        "CapacityBytes": 3840755982336,
+        "Status": {"State": "Enabled", "Health": "OK"},
+        "Oem": {"SmartData": smart_data},
+    }
+
+class MockBMC(object):
+
+    def __init__(self, tree, latency=0, jitter=0, error_rate=0, timeout_rate=0, hang=120, etags=False,
+                 username=None, password=None, expand_levels=0):
+        self.tree = tree
+        self.expand_levels = expand_levels
+        if expand_levels:
+            tree[ROOT]["ProtocolFeaturesSupported"] = {
+                "ExpandQuery": {"ExpandAll": True, "NoLinks": True, "Levels": True, "MaxLevels": expand_levels},
+                "SelectQuery": True,
+            }
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.etags = etags
+        self.username = username
+        self.password = password
+
+        self.tokens = {}
+        self.session_ids = itertools.count(1)
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+
+    def delay(self):
+        latency = self.latency + random.uniform(0, self.jitter)
+        if random.random() < self.timeout_rate:
+            self.count("hung")
+            latency = self.hang
+        if latency:
+            time.sleep(latency)
+
+    def new_session(self):
+        # every session has its own token, so several exporters or pooled
+        # sessions can be logged in at the same time
+        with self.lock:
+            session_id = next(self.session_ids)
+            token = hashlib.sha256(os.urandom(16)).hexdigest()
+            self.tokens[token] = f"{ROOT}/SessionService/Sessions/{session_id}"
+            return token, self.tokens[token]
+
+    def delete_session(self, path):
+        with self.lock:
+            for token, session_url in list(self.tokens.items()):
+                if session_url == path:
+                    del self.tokens[token]
+                    return True
+        return False
+
+    def authorized(self, headers):
+        token = headers.get("X-Auth-Token")
+        if token is not None:
+            return token in self.tokens
+        return True
+
+class MockBMCHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    bmc = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, code, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, code, message):
+        self.send_json(code, {"error": {"code": f"Base.1.8.{code}", "message": message}})
+
+    def path_only(self):
+        return self.path.split("?")[0].rstrip("/") or "/"
+
+    def injected_error(self):
+        if random.random() < self.bmc.error_rate:
+            self.bmc.count("errors")
+            self.send_error_json(503, "Injected error")
+            return True
+        return False
+
+    def do_GET(self):
+        path = self.path_only()
+        if path == "/mock/stats":
+            return self.send_json(200, self.bmc.stats)
+
+        self.bmc.count("GET")
+        self.bmc.delay()
+        if self.injected_error():
+            return
+
+        if not self.bmc.authorized(self.headers):
+            self.bmc.count("unauthorized")
+            return self.send_error_json(401, "Invalid session token")
+
+        resource = self.bmc.tree.get(path)
+        if resource is None:
+            return self.send_error_json(404, f"{path} not found")
+
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        if self.bmc.expand_levels and "$expand" in query:
+            self.bmc.count("expanded")
+            mode, _, levels = query["$expand"][0].partition("($levels=")
+            levels = int(levels.rstrip(")") or 1)
+            if mode not in ("*", ".") or levels > self.bmc.expand_levels:
+                return self.send_error_json(400, f"Unsupported $expand {query['$expand'][0]}")
+            resource = expand(self.bmc.tree, resource, mode, levels)
+        if self.bmc.expand_levels and "$select" in query:
+            resource = select(resource, query["$select"][0].split(","))
+
+        if not self.bmc.etags:
+            return self.send_json(200, resource)
+
+        etag = '"%s"' % hashlib.sha1(json.dumps(resource, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        if self.headers.get("If-None-Match") == etag:
+            self.bmc.count("not_modified")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_json(200, resource, {"ETag": etag})
+
+    def do_POST(self):
+        path = self.path_only()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if path == "/mock/reset":
+            self.bmc.reset()
+            return self.send_json(200, {})
+
+        self.bmc.count("POST")
+        self.bmc.delay()
+        if path != f"{ROOT}/SessionService/Sessions":
+            return self.send_error_json(405, f"POST to {path} is not allowed")
+        if self.injected_error():
+            return
+
+        credentials = json.loads(body or b"{}")
+        if self.bmc.username is not None and (
+            credentials.get("UserName") != self.bmc.username or credentials.get("Password") != self.bmc.password
+        ):
+            return self.send_error_json(401, "Invalid credentials")
+
+        token, session_url = self.bmc.new_session()
+        self.send_json(201, {"@odata.id": session_url}, {"X-Auth-Token": token, "Location": session_url})
+
+    def do_DELETE(self):
+        self.bmc.count("DELETE")
+        if self.bmc.delete_session(self.path_only()):
+            return self.send_json(200, {})
+        self.send_error_json(404, f"{self.path_only()} not found")
+
+class MockBMCServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, context):
+        self.context = context
+        super().__init__(address, handler)
+
+    def finish_request(self, request, client_address):
+        # the TLS handshake runs in the thread of the connection
+        try:
+            request = self.context.wrap_socket(request, server_side=True)
+        except (ssl.SSLError, OSError):
+            return
+        self.RequestHandlerClass(request, client_address, self)
+
+def self_signed_certificate(directory):
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, 2048)
+
+    cert = crypto.X509()
+    cert.get_subject().CN = "mock-bmc"
+    cert.set_serial_number(1)
+    cert.gmtime_adj_notBefore(0)
+    cert.gmtime_adj_notAfter(365 * 24 * 3600)
+    cert.set_issuer(cert.get_subject())
+    cert.set_pubkey(key)
+    cert.sign(key, "sha256")
+
+    cert_file = os.path.join(directory, "mock-bmc.crt")
+    key_file = os.path.join(directory, "mock-bmc.key")
+    with open(cert_file, "wb") as output:
+        output.write(crypto.dump_certificate(crypto.FILETYPE_PEM, cert))
+    with open(key_file, "wb") as output:
+        output.write(crypto.dump_privatekey(crypto.FILETYPE_PEM, key))
+
+    return cert_file, key_file
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", help="Address to listen on", default="")
+    parser.add_argument("--port", help="Port to listen on", type=int, default=8443)
+    parser.add_argument("--storage-services", help="Storage services", type=int, default=2)
+    parser.add_argument("--pools", help="Storage pools per storage service", type=int, default=2)
+    parser.add_argument("--capacity-sources", help="Capacity sources per storage pool", type=int, default=1)
+    parser.add_argument("--drives", help="Drives per capacity source", type=int, default=6)
+    parser.add_argument("--latency", help="Seconds before every response", type=float, default=0)
+    parser.add_argument("--jitter", help="Random seconds added to the latency", type=float, default=0)
+    parser.add_argument("--error-rate", help="Fraction of requests answered with 503", type=float, default=0)
+    parser.add_argument("--timeout-rate", help="Fraction of requests that hang", type=float, default=0)
+    parser.add_argument("--hang", help="Seconds a hanging request waits before it is answered", type=float, default=120)
+    parser.add_argument("--etags", help="Send ETags and answer If-None-Match with 304", action="store_true")
+    parser.add_argument("--expand", help="Answer $expand queries up to this many levels", type=int, default=0)
+    parser.add_argument("--username", help="Accept only this user, any user if not set")
+    parser.add_argument("--password", help="Password of the user", default="")
+    parser.add_argument("--cert", help="TLS certificate, a self-signed one is generated if not set")
+    parser.add_argument("--key", help="TLS key of the certificate")
+    args = parser.parse_args()
+
+    tree = build_tree(args.storage_services, args.pools, args.capacity_sources, args.drives)
+    MockBMCHandler.bmc = MockBMC(
+        tree,
+        latency = args.latency,
+        jitter = args.jitter,
+        error_rate = args.error_rate,
+        timeout_rate = args.timeout_rate,
+        hang = args.hang,
+        etags = args.etags,
+        username = args.username,
+        password = args.password,
+        expand_levels = args.expand,
+    )
+
+    cert_file, key_file = args.cert, args.key
+    if not cert_file:
+        cert_file, key_file = self_signed_certificate(tempfile.mkdtemp(prefix="mock-bmc-"))
+
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_file, key_file)
+
+    server = MockBMCServer((args.host, args.port), MockBMCHandler, context)
+
+    drives = len([path for path in tree if "/Drives/" in path])
+    print(f"Mock BMC with {drives} drives listening on port {args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
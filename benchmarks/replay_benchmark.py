@@ -0,0 +1,169 @@
+"""
+Replay benchmark of the exporter with recorded BMC traffic.
+
+Starts main.py in replay mode, so the Redfish requests of every target are
+answered from the captures instead of a BMC, scrapes the /health endpoint
+and reports the scrape latency, the BMC requests per scrape and the CPU
+time of the exporter. No BMC or network access is needed.
+
+Record the captures of a node by running the exporter with capture.mode
+set to record and scraping the node, e.g. once after a restart for the
+login and once more for a scrape with a pooled session:
+
+    capture:
+      mode: record
+      directory: captures/node-48
+
+Then replay them with the recorded latencies and compare the results of
+two versions of the exporter:
+
+    python benchmarks/replay_benchmark.py --captures captures/node-48 --scrapes 100 --output old.json
+    python benchmarks/replay_benchmark.py --captures captures/node-48 --scrapes 100 --baseline old.json
+
+Every target replays the same captures. Settings of the exporter are
+overridden with --set key=value like in scrape_benchmark.py.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import yaml
+
+from scrape_benchmark import REPO, percentile, process_usage, scrape, set_option, wait_for
+
+REQUESTS_RE = re.compile(r"^redfish_exporter_bmc_responses_total\{.*\} (\S+)$", re.MULTILINE)
+
+# lower is better for all of them
+COMPARED = [
+    ("latency_p50", "latency p50", 1000, "ms"),
+    ("latency_p99", "latency p99", 1000, "ms"),
+    ("bmc_requests_per_scrape", "BMC requests/scrape", 1, ""),
+    ("exporter_cpu_seconds_per_scrape", "exporter CPU/scrape", 1000, "ms"),
+]
+
+def bmc_requests(port):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=10) as response:
+        return sum(float(value) for value in REQUESTS_RE.findall(response.read().decode("utf-8")))
+
+def compare(report, baseline):
+    print(f"{'':24}{'baseline':>12}{'current':>12}{'change':>10}")
+    for key, name, factor, unit in COMPARED:
+        old, new = baseline.get(key), report.get(key)
+        if old is None or new is None:
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"{name:24}{old * factor:>10.1f}{unit:>2}{new * factor:>10.1f}{unit:>2}{change:>10}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--captures", help="Capture file or directory of capture files", required=True)
+    parser.add_argument("--config", help="Base config of the exporter", default=os.path.join(REPO, "config.yml"))
+    parser.add_argument("--set", help="Override a setting of the config, e.g. engine=async", action="append", default=[])
+    parser.add_argument("--exporter-port", help="Port of the exporter", type=int, default=19220)
+    parser.add_argument("--targets", help="Number of targets", type=int, default=1)
+    parser.add_argument("--scrapes", help="Number of measured scrapes", type=int, default=100)
+    parser.add_argument("--concurrency", help="Concurrent scrapes", type=int, default=4)
+    parser.add_argument("--scrape-timeout", help="Seconds a scrape may take", type=float, default=120)
+    parser.add_argument("--latency-scale", help="Factor of the recorded latencies, 0 replays without latency", type=float, default=1.0)
+    parser.add_argument("--output", help="Save the results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare the results with the JSON results of an earlier run")
+    parser.add_argument("--json", help="Print the results as JSON", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.config) as config_file:
+        config = yaml.safe_load(config_file) or {}
+    config.update({
+        "listen_port": args.exporter_port,
+        "capture": {
+            "mode": "replay",
+            "directory": os.path.abspath(args.captures),
+            "latency_scale": args.latency_scale,
+        },
+    })
+    for option in args.set:
+        set_option(config, option)
+
+    workdir = tempfile.mkdtemp(prefix="redfish-replay-")
+    config_path = os.path.join(workdir, "config.yml")
+    with open(config_path, "w") as config_file:
+        yaml.safe_dump(config, config_file)
+
+    exporter = subprocess.Popen(
+        [sys.executable, os.path.join(REPO, "main.py"), "-c", config_path, "-l", os.path.join(workdir, "exporter.log")],
+        cwd = REPO,
+        stdout = subprocess.DEVNULL,
+        stderr = subprocess.DEVNULL,
+    )
+    try:
+        wait_for(f"http://127.0.0.1:{args.exporter_port}/")
+
+        targets = [f"127.0.0.{index + 1}" for index in range(args.targets)]
+        urls = [f"http://127.0.0.1:{args.exporter_port}/health?target={target}" for target in targets]
+
+        # log in and fill the caches before measuring
+        for url in urls:
+            scrape(url, args.scrape_timeout)
+
+        requests_before = bmc_requests(args.exporter_port)
+        cpu_before, _, _ = process_usage(exporter.pid)
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(
+                lambda index: scrape(urls[index % len(urls)], args.scrape_timeout),
+                range(args.scrapes)
+            ))
+        wall_seconds = time.time() - start
+        cpu_after, rss, peak_rss = process_usage(exporter.pid)
+        requests_after = bmc_requests(args.exporter_port)
+
+    finally:
+        exporter.terminate()
+        exporter.wait()
+
+    latencies = [latency for latency, ok in results]
+    report = {
+        "captures": args.captures,
+        "latency_scale": args.latency_scale,
+        "scrapes": len(results),
+        "failed": len([ok for latency, ok in results if not ok]),
+        "concurrency": args.concurrency,
+        "targets": args.targets,
+        "scrapes_per_second": len(results) / wall_seconds,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p99": percentile(latencies, 0.99),
+        "latency_max": max(latencies),
+        "bmc_requests_per_scrape": (requests_after - requests_before) / len(results),
+        "exporter_cpu_seconds_per_scrape": (cpu_after - cpu_before) / len(results),
+        "exporter_rss_mib": rss,
+        "exporter_peak_rss_mib": peak_rss,
+    }
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"scrapes                {report['scrapes']} ({report['failed']} failed), "
+              f"{args.targets} targets, concurrency {args.concurrency}, latency scale {args.latency_scale}")
+        print(f"throughput             {report['scrapes_per_second']:.1f} scrapes/s")
+        print(f"latency p50/p99/max    {report['latency_p50'] * 1000:.0f} / "
+              f"{report['latency_p99'] * 1000:.0f} / {report['latency_max'] * 1000:.0f} ms")
+        print(f"BMC requests/scrape    {report['bmc_requests_per_scrape']:.1f}")
+        print(f"exporter CPU/scrape    {report['exporter_cpu_seconds_per_scrape'] * 1000:.1f} ms")
+        print(f"exporter RSS           {rss:.1f} MiB (peak {peak_rss:.1f} MiB)")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            compare(report, json.load(baseline_file))
+
+if __name__ == "__main__":
+    main()
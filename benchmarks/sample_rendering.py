@@ -0,0 +1,115 @@
+"""
+Microbenchmark of the SMART sample collection and exposition per drive.
+
+Parses generated NVMe and SAS drives with HealthCollector.parse_smart_info
+and renders the exposition text, once with the SampleBuffer and the
+exposition writer of the exporter and once with a GaugeMetricFamily and
+generate_latest, which build a Sample and format the labels of every
+sample. Reports the CPU time and the allocated memory per drive.
+
+    python benchmarks/sample_rendering.py [--drives N] [--number N]
+"""
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.exposition import generate_latest
+from prometheus_client.samples import Sample
+
+import argparse
+import logging
+import os
+import re
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import collectors.health_collector as health_collector
+from collectors.health_collector import HealthCollector
+from collectors.smart_attributes import SMART_TABLES
+from exposition import MetricFamilyRegistry, render_family
+from mock_bmc import build_drive
+from request_log import RequestLogger
+
+class GaugeBuffer(GaugeMetricFamily):
+    # the add_sample of a SampleBuffer on a GaugeMetricFamily, as before the buffer
+
+    def __init__(self, name, documentation):
+        super().__init__(name, documentation, labels=[])
+
+    def add_sample(self, name, labels, value):
+        self.samples.append(Sample(name, labels, value, None, None))
+
+class DriveCollector(object):
+    # the attributes of RedfishMetricsCollector that HealthCollector reads
+
+    def __init__(self):
+        self.target = "10.0.0.1"
+        self.host = "node-1"
+        self.labels = {"host": self.host, "redfish_instance": f"{self.target}:9220"}
+        self.status = {"ok": 1, "enabled": 0, "absent": 0}
+        self.request_log = RequestLogger(level=logging.DEBUG)
+
+def collect(drives, buffered):
+    col = DriveCollector()
+    health = HealthCollector(col)
+    chunks = []
+    for drive in drives:
+        health.health_metrics = health.new_health_metrics()
+        health.parse_smart_info(drive, SMART_TABLES[drive["MediaType"].lower()])
+        chunks.append(health.health_metrics)
+
+    if buffered:
+        return b"".join(render_family(chunk, index == 0) for index, chunk in enumerate(chunks))
+    return b"".join(
+        generate_latest(MetricFamilyRegistry(chunk)) if index == 0
+        else generate_latest(MetricFamilyRegistry(chunk)).split(b"\n", 2)[2]
+        for index, chunk in enumerate(chunks)
+    )
+
+def use_buffer(buffered):
+    if buffered:
+        health_collector.SampleBuffer = ORIGINAL_BUFFER
+        health_collector.intern_labels = ORIGINAL_INTERN
+    else:
+        health_collector.SampleBuffer = GaugeBuffer
+        health_collector.intern_labels = lambda labels: labels
+
+ORIGINAL_BUFFER = health_collector.SampleBuffer
+ORIGINAL_INTERN = health_collector.intern_labels
+
+RUN_TIME_RE = re.compile(rb"^(smartmon_smartctl_run\{.*\}) \S+$", re.MULTILINE)
+
+def run(name, drives, buffered, number, baseline=None):
+    use_buffer(buffered)
+    seconds = min(timeit.repeat(lambda: collect(drives, buffered), number=number, repeat=3))
+    per_drive = seconds / number / len(drives) * 1e6
+
+    tracemalloc.start()
+    collect(drives, buffered)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    speedup = (baseline or per_drive) / per_drive
+    print(f"{name:<28} {per_drive:8.1f} us/drive {speedup:6.2f}x {peak / len(drives) / 1024:8.1f} KiB/drive peak")
+    return per_drive
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--drives", help="Drives per scrape", type=int, default=48)
+    parser.add_argument("--number", help="Scrapes per measurement", type=int, default=50)
+    args = parser.parse_args()
+
+    drives = [build_drive(f"/redfish/v1/Chassis/1/Drives/D{index}", index) for index in range(args.drives)]
+
+    use_buffer(False)
+    expected = collect(drives, False)
+    use_buffer(True)
+    if RUN_TIME_RE.sub(rb"\1", collect(drives, True)) != RUN_TIME_RE.sub(rb"\1", expected):
+        sys.exit("The exposition texts differ")
+
+    print(f"{args.drives} drives, {expected.count(b'smartmon_')} samples\n")
+    baseline = run("GaugeMetricFamily", drives, False, args.number)
+    run("SampleBuffer", drives, True, args.number, baseline)
+
+if __name__ == "__main__":
+    main()
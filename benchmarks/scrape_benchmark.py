@@ -0,0 +1,248 @@
+"""
+Scrape benchmark of the exporter against simulated BMCs.
+
+Starts benchmarks/mock_bmc.py and main.py with a generated config, scrapes
+the /health endpoint of the exporter with the given concurrency and reports
+the scrape latency, the BMC requests per scrape and the CPU time and memory
+of the exporter and its worker processes.
+
+    python benchmarks/scrape_benchmark.py --targets 4 --scrapes 200 --concurrency 8 --latency 0.02
+
+Every target is a loopback address (127.0.0.1, 127.0.0.2, ...) of the same
+mock BMC. Settings of the exporter are overridden with --set key=value,
+e.g. --set engine=async --set resource_cache.enabled=true.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import argparse
+import json
+import os
+import re
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import yaml
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+UP_RE = re.compile(r"^redfish_up\{.*\} 1\.0$", re.MULTILINE)
+
+# the mock BMC has a self-signed certificate
+MOCK_CONTEXT = ssl._create_unverified_context()
+
+def set_option(config, option):
+    key, value = option.split("=", 1)
+    section = config
+    *sections, name = key.split(".")
+    for section_name in sections:
+        section = section.setdefault(section_name, {}) or {}
+    section[name] = yaml.safe_load(value)
+
+def wait_for(url, timeout=30):
+    start = time.time()
+    while time.time() - start < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} is not reachable after {timeout} seconds")
+
+def mock_stats(port):
+    with urllib.request.urlopen(f"https://127.0.0.1:{port}/mock/stats", context=MOCK_CONTEXT) as response:
+        return json.loads(response.read())
+
+def reset_mock_stats(port):
+    request = urllib.request.Request(f"https://127.0.0.1:{port}/mock/reset", data=b"", method="POST")
+    urllib.request.urlopen(request, context=MOCK_CONTEXT).close()
+
+def stat_fields(pid):
+    with open(f"/proc/{pid}/stat") as stat_file:
+        return stat_file.read().rsplit(")", 1)[1].split()
+
+def process_tree(pid):
+    """
+    Return the pid and the pids of the descendants of a process, e.g. the
+    server and collection worker processes of the exporter.
+    """
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                parents[int(entry)] = int(stat_fields(entry)[1])
+            except (OSError, IndexError):
+                pass
+
+    tree = [pid]
+    for process in tree:
+        tree.extend(child for child, parent in parents.items() if parent == process)
+    return tree
+
+def process_usage(pid):
+    """
+    Return the CPU seconds, the resident and the peak resident memory in MiB
+    of a process and its descendants, read from /proc.
+    """
+    cpu_seconds = rss = peak_rss = 0
+    for process in process_tree(pid):
+        try:
+            fields = stat_fields(process)
+            cpu_seconds += (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+            with open(f"/proc/{process}/status") as status_file:
+                for line in status_file:
+                    if line.startswith("VmRSS:"):
+                        rss += int(line.split()[1]) / 1024
+                    elif line.startswith("VmHWM:"):
+                        peak_rss += int(line.split()[1]) / 1024
+        except OSError:
+            pass
+
+    return cpu_seconds, rss, peak_rss
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+def scrape(url, timeout):
+    start = time.time()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            ok = response.status == 200 and bool(UP_RE.search(response.read().decode("utf-8")))
+    except OSError:
+        ok = False
+    return time.time() - start, ok
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", help="Base config of the exporter", default=os.path.join(REPO, "config.yml"))
+    parser.add_argument("--set", help="Override a setting of the config, e.g. engine=async", action="append", default=[])
+    parser.add_argument("--exporter-port", help="Port of the exporter", type=int, default=19220)
+    parser.add_argument("--bmc-port", help="Port of the mock BMC", type=int, default=18443)
+    parser.add_argument("--targets", help="Number of targets", type=int, default=1)
+    parser.add_argument("--scrapes", help="Number of measured scrapes", type=int, default=100)
+    parser.add_argument("--concurrency", help="Concurrent scrapes", type=int, default=4)
+    parser.add_argument("--scrape-timeout", help="Seconds a scrape may take", type=float, default=120)
+    parser.add_argument("--drives", help="Drives per capacity source of the mock BMC", type=int, default=6)
+    parser.add_argument("--latency", help="Response latency of the mock BMC", type=float, default=0.02)
+    parser.add_argument("--jitter", help="Random latency added by the mock BMC", type=float, default=0)
+    parser.add_argument("--error-rate", help="Fraction of mock BMC requests answered with 503", type=float, default=0)
+    parser.add_argument("--timeout-rate", help="Fraction of mock BMC requests that hang", type=float, default=0)
+    parser.add_argument("--hang", help="Seconds a hanging mock BMC request waits", type=float, default=120)
+    parser.add_argument("--etags", help="Let the mock BMC send ETags", action="store_true")
+    parser.add_argument("--expand", help="Let the mock BMC answer $expand queries up to this many levels", type=int, default=0)
+    parser.add_argument("--json", help="Print the results as JSON", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.config) as config_file:
+        config = yaml.safe_load(config_file) or {}
+    config.update({
+        "listen_port": args.exporter_port,
+        "rf_port": args.bmc_port,
+        "username": "benchmark",
+        "password": "benchmark",
+    })
+    for option in args.set:
+        set_option(config, option)
+
+    workdir = tempfile.mkdtemp(prefix="redfish-benchmark-")
+    config_path = os.path.join(workdir, "config.yml")
+    with open(config_path, "w") as config_file:
+        yaml.safe_dump(config, config_file)
+
+    mock_command = [
+        sys.executable, os.path.join(REPO, "benchmarks", "mock_bmc.py"),
+        "--port", str(args.bmc_port),
+        "--drives", str(args.drives),
+        "--latency", str(args.latency),
+        "--jitter", str(args.jitter),
+        "--error-rate", str(args.error_rate),
+        "--timeout-rate", str(args.timeout_rate),
+        "--hang", str(args.hang),
+        "--expand", str(args.expand),
+        "--username", "benchmark",
+        "--password", "benchmark",
+    ]
+    if args.etags:
+        mock_command.append("--etags")
+
+    # a CA bundle from the environment would make requests verify the
+    # certificate of the mock BMC
+    exporter_env = dict(os.environ)
+    for name in ("REQUESTS_CA_BUNDLE", "CURL_CA_BUNDLE"):
+        exporter_env.pop(name, None)
+
+    mock = subprocess.Popen(mock_command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    exporter = None
+    try:
+        mock.stdout.readline()
+        exporter = subprocess.Popen(
+            [sys.executable, os.path.join(REPO, "main.py"), "-c", config_path, "-l", os.path.join(workdir, "exporter.log")],
+            cwd = REPO,
+            env = exporter_env,
+            stdout = subprocess.DEVNULL,
+            stderr = subprocess.DEVNULL,
+        )
+        wait_for(f"http://127.0.0.1:{args.exporter_port}/")
+
+        targets = [f"127.0.0.{index + 1}" for index in range(args.targets)]
+        urls = [f"http://127.0.0.1:{args.exporter_port}/health?target={target}" for target in targets]
+
+        # log in and fill the caches before measuring
+        for url in urls:
+            scrape(url, args.scrape_timeout)
+
+        reset_mock_stats(args.bmc_port)
+        cpu_before, _, _ = process_usage(exporter.pid)
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(
+                lambda index: scrape(urls[index % len(urls)], args.scrape_timeout),
+                range(args.scrapes)
+            ))
+        wall_seconds = time.time() - start
+        cpu_after, rss, peak_rss = process_usage(exporter.pid)
+        stats = mock_stats(args.bmc_port)
+
+    finally:
+        for process in (exporter, mock):
+            if process:
+                process.terminate()
+                process.wait()
+
+    latencies = [latency for latency, ok in results]
+    bmc_requests = sum(stats.get(method, 0) for method in ("GET", "POST", "DELETE"))
+    report = {
+        "scrapes": len(results),
+        "failed": len([ok for latency, ok in results if not ok]),
+        "concurrency": args.concurrency,
+        "targets": args.targets,
+        "scrapes_per_second": len(results) / wall_seconds,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p99": percentile(latencies, 0.99),
+        "latency_max": max(latencies),
+        "bmc_requests_per_scrape": bmc_requests / len(results),
+        "bmc_requests": stats,
+        "exporter_cpu_seconds_per_scrape": (cpu_after - cpu_before) / len(results),
+        "exporter_rss_mib": rss,
+        "exporter_peak_rss_mib": peak_rss,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"scrapes                {report['scrapes']} ({report['failed']} failed), "
+          f"{args.targets} targets, concurrency {args.concurrency}")
+    print(f"throughput             {report['scrapes_per_second']:.1f} scrapes/s")
+    print(f"latency p50/p99/max    {report['latency_p50'] * 1000:.0f} / "
+          f"{report['latency_p99'] * 1000:.0f} / {report['latency_max'] * 1000:.0f} ms")
+    print(f"BMC requests/scrape    {report['bmc_requests_per_scrape']:.1f} {json.dumps(stats, sort_keys=True)}")
+    print(f"exporter CPU/scrape    {report['exporter_cpu_seconds_per_scrape'] * 1000:.1f} ms")
+    print(f"exporter RSS           {rss:.1f} MiB (peak {peak_rss:.1f} MiB)")
+
+if __name__ == "__main__":
+    main()
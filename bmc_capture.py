@@ -0,0 +1,349 @@
+from collections import OrderedDict
+from multidict import CIMultiDict, CIMultiDictProxy
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import urlsplit
+from yarl import URL
+
+import aiohttp
+import asyncio
+import glob
+import gzip
+import http.client
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+import requests
+
+CAPTURE_VERSION = 1
+
+REDACTED = "REDACTED"
+
+# response headers kept in a capture, the token is redacted
+CAPTURED_HEADERS = ["Content-Type", "ETag", "Location", "X-Auth-Token"]
+
+# fields of the request and response bodies that are redacted
+REDACTED_FIELDS = ["Password", "UserName"]
+
+# response codes of the exporter metrics that are no HTTP status
+ERROR_CODES = {"408": "timeout", "deadline": "timeout", "444": "connection", "error": "error"}
+
+def redact(payload, fields):
+    if isinstance(payload, dict):
+        return {
+            key: REDACTED if key in fields else redact(value, fields)
+            for key, value in payload.items()
+        }
+    if isinstance(payload, list):
+        return [redact(item, fields) for item in payload]
+
+    return payload
+
+def redact_body(body, fields):
+    """
+    Return the body as text with the values of the redacted fields replaced,
+    a body that is not JSON is kept as it is.
+    """
+    if not body:
+        return ""
+
+    text = body.decode("utf-8", "replace") if isinstance(body, bytes) else body
+    if not any(field in text for field in fields):
+        return text
+
+    try:
+        return json.dumps(redact(json.loads(text), fields))
+    except ValueError:
+        return text
+
+def captured_headers(headers):
+    captured = {}
+    for name in CAPTURED_HEADERS:
+        value = headers.get(name) if headers else None
+        if value is not None:
+            captured[name] = REDACTED if name == "X-Auth-Token" else value
+    return captured
+
+class ScrapeCapture(object):
+    """
+    The Redfish requests of one scrape with their responses and timing.
+    """
+
+    def __init__(self, recorder, target, metrics_type):
+        self.recorder = recorder
+        self.target = target
+        self.metrics_type = metrics_type
+        self.started = time.time()
+        self.exchanges = []
+        self._lock = threading.Lock()
+
+    def record(self, method, url, request_body, code, headers, body, request_start, duration):
+        """
+        Record a request with the response code of the exporter metrics, the
+        408 and 444 codes of timeouts and connection errors have no response.
+        """
+        parts = urlsplit(url)
+        error = ERROR_CODES.get(code)
+        exchange = {
+            "method": method,
+            "path": parts.path + (f"?{parts.query}" if parts.query else ""),
+            "status": None if error else int(code),
+            "headers": captured_headers(headers),
+            "body": redact_body(body, self.recorder.redacted_fields),
+            "offset": round(request_start - self.started, 6),
+            "duration": round(duration, 6),
+        }
+        if request_body is not None:
+            exchange["request_body"] = redact(request_body, self.recorder.redacted_fields)
+        if error:
+            exchange["error"] = error
+
+        with self._lock:
+            self.exchanges.append(exchange)
+
+    def save(self):
+        if self.exchanges:
+            self.recorder.save(self)
+
+class CaptureRecorder(object):
+    """
+    Record the Redfish requests and responses of every scrape with their
+    timing, so the scrape can be replayed without the BMC.
+
+    Every scrape is saved to its own gzipped JSON file in directory. Session
+    tokens and the values of the redacted fields are replaced, the basic
+    auth credentials are never recorded.
+    """
+
+    def __init__(self, directory, redacted_fields=None):
+        self.directory = directory
+        self.redacted_fields = set(REDACTED_FIELDS + list(redacted_fields or []))
+        self._sequence = itertools.count()
+
+    def start(self, target, metrics_type):
+        return ScrapeCapture(self, target, metrics_type)
+
+    def filename(self, capture):
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", capture.target)
+        started = time.strftime("%Y%m%dT%H%M%S", time.gmtime(capture.started))
+        return os.path.join(self.directory, f"{name}-{capture.metrics_type}-{started}-{next(self._sequence)}.json.gz")
+
+    def save(self, capture):
+        data = {
+            "version": CAPTURE_VERSION,
+            "target": capture.target,
+            "metrics_type": capture.metrics_type,
+            "started": capture.started,
+            "exchanges": capture.exchanges,
+        }
+        filename = self.filename(capture)
+        try:
+            with gzip.open(filename, "wt", encoding="utf8") as capture_file:
+                json.dump(data, capture_file, separators=(",", ":"))
+            logging.debug("Target %s: Saved %s requests to %s", capture.target, len(capture.exchanges), filename)
+
+        except OSError as err:
+            logging.warning("Target %s: Could not save the capture: %s", capture.target, err)
+
+def load_captures(path):
+    """
+    Return the captures of a capture file or of all capture files in a directory.
+    """
+    filenames = [path]
+    if os.path.isdir(path):
+        filenames = sorted(glob.glob(os.path.join(path, "*.json.gz")))
+
+    captures = []
+    for filename in filenames:
+        with gzip.open(filename, "rt", encoding="utf8") as capture_file:
+            capture = json.load(capture_file)
+        if capture.get("version") != CAPTURE_VERSION:
+            raise ValueError(f"{filename} is a capture of version {capture.get('version')}")
+        captures.append(capture)
+
+    return captures
+
+class Replayer(object):
+    """
+    Answer the Redfish requests of every target with the responses of the
+    captures instead of the BMC, after the recorded latency multiplied by
+    latency_scale.
+
+    The recorded responses of a request are served in turn. A request that
+    sends the ETag of its response gets a 304, one that was not recorded a
+    404. A login is answered with a replay session if no login was recorded.
+    """
+
+    def __init__(self, captures, latency_scale=1.0):
+        self.latency_scale = latency_scale
+        self.requests = 0
+
+        self._exchanges = OrderedDict()
+        for capture in captures:
+            for exchange in capture["exchanges"]:
+                # a 304 carries no body, the recorded 200 of the request is served instead
+                if exchange["status"] == 304:
+                    continue
+                self._exchanges.setdefault((exchange["method"], exchange["path"]), []).append(exchange)
+
+        self._turns = {}
+        self._lock = threading.Lock()
+        self.adapter = ReplayAdapter(self)
+
+    def exchange(self, method, url):
+        parts = urlsplit(url)
+        key = (method, parts.path + (f"?{parts.query}" if parts.query else ""))
+        with self._lock:
+            self.requests += 1
+            exchanges = self._exchanges.get(key)
+            if not exchanges:
+                return self.missing(*key)
+
+            turn = self._turns.get(key, 0)
+            self._turns[key] = turn + 1
+            return exchanges[turn % len(exchanges)]
+
+    @staticmethod
+    def missing(method, path):
+        if method == "POST" and path.endswith("/Sessions"):
+            return {
+                "status": 201,
+                "headers": {"X-Auth-Token": REDACTED, "Location": f"{path}/replay"},
+                "body": json.dumps({"@odata.id": f"{path}/replay"}),
+                "duration": 0,
+            }
+
+        logging.debug("Replaying a 404 for the unrecorded request %s %s", method, path)
+        return {
+            "status": 404,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"error": {"code": "Base.1.8.ResourceMissingAtURI", "message": f"{path} was not recorded"}}),
+            "duration": 0,
+        }
+
+    def response(self, exchange, request_headers):
+        """
+        Return the status, headers and body of the response to an exchange.
+        """
+        headers = dict(exchange["headers"])
+        etag = headers.get("ETag")
+        if etag and request_headers and request_headers.get("If-None-Match") == etag:
+            return 304, headers, b""
+
+        return exchange["status"], headers, exchange["body"].encode("utf-8")
+
+    def latency(self, exchange, read_timeout):
+        """
+        Return the seconds to wait before the response and whether the
+        request times out instead.
+        """
+        latency = exchange["duration"] * self.latency_scale
+        timed_out = exchange.get("error") == "timeout"
+        if read_timeout is not None and latency > read_timeout:
+            return read_timeout, True
+
+        return latency, timed_out
+
+    async def async_request(self, method, url, timeout=None, headers=None, raise_for_status=False, **kwargs):
+        """
+        Return the status, headers and body of the replayed response like
+        AsyncRedfishMetricsCollector._async_request.
+        """
+        exchange = self.exchange(method, url)
+        latency, timed_out = self.latency(exchange, timeout.sock_read if timeout else None)
+        await asyncio.sleep(latency)
+        if timed_out:
+            raise asyncio.TimeoutError()
+        if exchange.get("error") in ("connection", "error"):
+            raise aiohttp.ClientConnectionError(f"Recorded connection error of {url}")
+
+        status, response_headers, body = self.response(exchange, headers)
+        response_headers = CIMultiDictProxy(CIMultiDict(response_headers))
+        if raise_for_status and status >= 400:
+            request_info = aiohttp.RequestInfo(URL(url), method, CIMultiDictProxy(CIMultiDict(headers or {})), URL(url))
+            raise aiohttp.ClientResponseError(request_info, (), status=status, headers=response_headers)
+        return status, response_headers, body
+
+class ReplayAdapter(BaseAdapter):
+    """
+    requests transport adapter answering the requests of a session with the
+    Replayer instead of the network.
+    """
+
+    def __init__(self, replayer):
+        super().__init__()
+        self.replayer = replayer
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        exchange = self.replayer.exchange(request.method, request.url)
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        latency, timed_out = self.replayer.latency(exchange, read_timeout)
+        time.sleep(latency)
+        if timed_out:
+            raise requests.exceptions.ReadTimeout(f"Recorded timeout of {request.url}", request=request)
+        if exchange.get("error") in ("connection", "error"):
+            raise requests.exceptions.ConnectionError(f"Recorded connection error of {request.url}", request=request)
+
+        status, headers, body = self.replayer.response(exchange, request.headers)
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = body
+        response.url = request.url
+        response.request = request
+        response.encoding = "utf-8"
+        response.reason = http.client.responses.get(status, "")
+        return response
+
+    def close(self):
+        pass
+
+_capture_lock = threading.Lock()
+_capture_recorder = None
+_replayer = None
+
+def capture_mode(config):
+    # yaml reads an unquoted off as False
+    return str((config.get("capture") or {}).get("mode") or "").lower()
+
+def get_capture_recorder(config):
+    """
+    Return the capture recorder, or None if the scrapes are not recorded.
+    """
+    global _capture_recorder
+
+    if capture_mode(config) != "record":
+        return None
+
+    capture_config = config.get("capture") or {}
+    with _capture_lock:
+        if _capture_recorder is None:
+            directory = capture_config.get("directory") or "captures"
+            os.makedirs(directory, exist_ok=True)
+            _capture_recorder = CaptureRecorder(directory, capture_config.get("redacted_fields"))
+            logging.warning("Recording the Redfish requests of every scrape to %s", directory)
+
+    return _capture_recorder
+
+def get_replayer(config):
+    """
+    Return the replayer, or None if the BMCs are connected.
+    """
+    global _replayer
+
+    if capture_mode(config) != "replay":
+        return None
+
+    capture_config = config.get("capture") or {}
+    with _capture_lock:
+        if _replayer is None:
+            directory = capture_config.get("directory") or "captures"
+            captures = load_captures(directory)
+            _replayer = Replayer(captures, float(capture_config.get("latency_scale", 1.0)))
+            logging.warning("Replaying %s captured scrapes from %s instead of connecting to the BMCs", len(captures), directory)
+
+    return _replayer
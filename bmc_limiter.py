@@ -0,0 +1,255 @@
+from collections import OrderedDict, deque
+from prometheus_client.core import GaugeMetricFamily
+
+import asyncio
+import threading
+import time
+
+from exporter_metrics import REGISTRY, BMC_BACKOFFS, BMC_THROTTLED
+
+# responses telling that the BMC is overloaded
+BACKOFF_CODES = {"408": "timeout", "444": "connection_error", "429": "too_many_requests", "503": "unavailable"}
+
+class BMCLimiter(object):
+    """
+    Rate and concurrency limit of the Redfish requests to one BMC.
+
+    Requests are paced by a token bucket of rate requests per second that
+    allows bursts of burst requests. The number of requests in flight is
+    limited by an AIMD limit: every successful request raises it by
+    1/limit, a timeout, connection error, 429 or 503 halves it. The limit
+    is halved at most once per backoff_interval seconds, so the failures
+    of one burst count once.
+
+    Requests waiting for a slot are served first in, first out. A request
+    gives up after its timeout and leaves the queue.
+    """
+
+    def __init__(self, target, target_class, rate, burst, initial_limit, min_limit, max_limit, backoff_interval=1):
+        self.target = target
+        self.target_class = target_class
+
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._refilled_at = time.monotonic()
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.backoff_interval = backoff_interval
+        self._backoff_at = 0
+        self.in_flight = 0
+
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _rate_delay(self):
+        if self.rate <= 0:
+            return 0
+
+        # the tokens may go negative, a request waits until its token is refilled
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+
+        if delay:
+            BMC_THROTTLED.labels(self.target_class, "rate").inc()
+        return delay
+
+    def _return_token(self):
+        # a request that gave up did not use its token, called with the lock held
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+    def _try_acquire(self):
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+
+        BMC_THROTTLED.labels(self.target_class, "concurrency").inc()
+        return False
+
+    def acquire(self, timeout=None):
+        """
+        Wait for the rate and concurrency limit at most timeout seconds.
+        Returns False if the request did not get a slot in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = self._rate_delay()
+        if delay:
+            if timeout is not None and delay > timeout:
+                with self._lock:
+                    self._return_token()
+                return False
+            time.sleep(delay)
+
+        with self._lock:
+            if self._try_acquire():
+                return True
+            acquired = threading.Event()
+            waiter = acquired.set
+            self._waiters.append(waiter)
+
+        # the slot is handed over by release
+        if acquired.wait(None if deadline is None else max(0, deadline - time.monotonic())):
+            return True
+
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._return_token()
+                return False
+
+        # handed over after the timeout
+        return True
+
+    async def async_acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = self._rate_delay()
+        if delay:
+            if timeout is not None and delay > timeout:
+                with self._lock:
+                    self._return_token()
+                return False
+            await asyncio.sleep(delay)
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire():
+                return True
+            acquired = loop.create_future()
+            waiter = lambda: loop.call_soon_threadsafe(self._hand_over, acquired)
+            self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(acquired, None if deadline is None else max(0, deadline - time.monotonic()))
+            return True
+
+        except asyncio.TimeoutError:
+            # a slot handed over in the meantime is released by _hand_over
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                self._return_token()
+            return False
+
+    def _hand_over(self, acquired):
+        if acquired.cancelled():
+            self.release(None)
+        else:
+            acquired.set_result(None)
+
+    def release(self, code):
+        """
+        Release the slot of a request with the status code of its response,
+        "408" and "444" for timeouts and connection errors.
+        """
+        with self._lock:
+            reason = BACKOFF_CODES.get(code)
+            if reason:
+                now = time.monotonic()
+                if now - self._backoff_at >= self.backoff_interval:
+                    self._backoff_at = now
+                    self.limit = max(float(self.min_limit), self.limit / 2)
+                BMC_BACKOFFS.labels(self.target_class, reason).inc()
+            elif code and code.isdigit():
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+            self.in_flight -= 1
+            while self._waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                self._waiters.popleft()()
+
+    def idle(self):
+        return self.in_flight == 0 and not self._waiters
+
+class BMCLimiters(object):
+    """
+    The limiters of all targets. Their limits and requests in flight are
+    summed up by target class, or reported per target with per_target_metrics.
+    """
+
+    def __init__(self, config, max_size=4096):
+        self.rate = float(config.get("rate", 0))
+        self.burst = max(1, int(config.get("burst", 10)))
+        self.initial_limit = int(config.get("initial_concurrency", 4))
+        self.min_limit = max(1, int(config.get("min_concurrency", 1)))
+        self.max_limit = max(self.min_limit, int(config.get("max_concurrency", 16)))
+        self.max_size = max_size
+        self.per_target_metrics = bool(config.get("per_target_metrics", False))
+
+        self._limiters = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, target, target_class):
+        with self._lock:
+            limiter = self._limiters.get(target)
+            if not limiter:
+                limiter = BMCLimiter(
+                    target, target_class, self.rate, self.burst,
+                    self.initial_limit, self.min_limit, self.max_limit
+                )
+                self._limiters[target] = limiter
+            self._limiters.move_to_end(target)
+
+            # forget the idle limiters of targets that were not scraped for a long time
+            if len(self._limiters) > self.max_size:
+                for old_target in list(self._limiters)[:len(self._limiters) - self.max_size]:
+                    if self._limiters[old_target].idle():
+                        del self._limiters[old_target]
+
+        return limiter
+
+    def collect(self):
+        with self._lock:
+            limiters = list(self._limiters.values())
+
+        labels = ["target_class", "target"] if self.per_target_metrics else ["target_class"]
+        limit_metrics = GaugeMetricFamily(
+            "redfish_exporter_bmc_concurrency_limit",
+            "Sum of the current adaptive limits of concurrent Redfish requests of the BMCs",
+            labels = labels,
+        )
+        in_flight_metrics = GaugeMetricFamily(
+            "redfish_exporter_bmc_requests_in_flight",
+            "Redfish requests to the BMCs in flight",
+            labels = labels,
+        )
+
+        limits = OrderedDict()
+        in_flight = OrderedDict()
+        for limiter in limiters:
+            key = (limiter.target_class, limiter.target) if self.per_target_metrics else (limiter.target_class,)
+            limits[key] = limits.get(key, 0) + int(limiter.limit)
+            in_flight[key] = in_flight.get(key, 0) + limiter.in_flight
+
+        for key in limits:
+            limit_metrics.add_metric(key, limits[key])
+            in_flight_metrics.add_metric(key, in_flight[key])
+
+        yield limit_metrics
+        yield in_flight_metrics
+
+_bmc_limiters = None
+_bmc_limiters_lock = threading.Lock()
+
+def get_bmc_limiter(config, target, target_class):
+    """
+    Return the limiter of the target, or None if limiting is disabled.
+    """
+    global _bmc_limiters
+
+    limits_config = config.get("bmc_limits") or {}
+    if not limits_config.get("enabled", True):
+        return None
+
+    with _bmc_limiters_lock:
+        if _bmc_limiters is None:
+            _bmc_limiters = BMCLimiters(limits_config)
+            REGISTRY.register(_bmc_limiters)
+
+    return _bmc_limiters.get(target, target_class)
@@ -0,0 +1,134 @@
+from collections import OrderedDict
+from prometheus_client.core import GaugeMetricFamily
+
+import logging
+import threading
+import time
+
+from exporter_metrics import REGISTRY
+
+CLOSED = 0
+OPEN = 1
+HALF_OPEN = 2
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker of one target.
+
+    After failure_threshold scrapes in a row could not connect to the BMC the
+    circuit opens and scrapes report the target as down without connecting.
+    When the backoff ran out a single scrape probes the BMC: if it connects
+    the circuit closes, otherwise it opens again with a doubled backoff of at
+    most max_backoff seconds.
+    """
+
+    def __init__(self, target, failure_threshold, backoff, max_backoff):
+        self.target = target
+        self.failure_threshold = failure_threshold
+        self.initial_backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.state = CLOSED
+        self.failures = 0
+        self.backoff = backoff
+        self.open_until = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Return True if the scrape may connect to the BMC, every allowed
+        scrape has to call record afterwards.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+
+            if self.state == OPEN and time.monotonic() >= self.open_until:
+                logging.info("Target %s: Probing the BMC after %s seconds", self.target, self.backoff)
+                self.state = HALF_OPEN
+                return True
+
+            return False
+
+    def record(self, connected):
+        with self._lock:
+            if connected:
+                if self.state != CLOSED:
+                    logging.info("Target %s: BMC is reachable again, closing the circuit", self.target)
+                self.state = CLOSED
+                self.failures = 0
+                self.backoff = self.initial_backoff
+                return
+
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self.backoff = min(self.max_backoff, self.backoff * 2)
+            elif self.failures < self.failure_threshold:
+                return
+
+            logging.warning(
+                "Target %s: BMC unreachable %s times, not connecting for %s seconds",
+                self.target, self.failures, self.backoff
+            )
+            self.state = OPEN
+            self.open_until = time.monotonic() + self.backoff
+
+class CircuitBreakers(object):
+
+    def __init__(self, config, max_size=4096):
+        self.failure_threshold = max(1, int(config.get("failure_threshold", 2)))
+        self.backoff = float(config.get("backoff", 30))
+        self.max_backoff = max(self.backoff, float(config.get("max_backoff", 600)))
+        self.max_size = max_size
+
+        self._breakers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, target):
+        with self._lock:
+            breaker = self._breakers.get(target)
+            if not breaker:
+                breaker = CircuitBreaker(target, self.failure_threshold, self.backoff, self.max_backoff)
+                self._breakers[target] = breaker
+            self._breakers.move_to_end(target)
+
+            # the least recently scraped targets are forgotten first
+            while len(self._breakers) > self.max_size:
+                self._breakers.popitem(last=False)
+
+        return breaker
+
+    def collect(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+
+        state_metrics = GaugeMetricFamily(
+            "redfish_exporter_circuit_state",
+            "State of the circuit breaker of the targets that are not closed (1 open, 2 half-open)",
+            labels = ["target"],
+        )
+        for breaker in breakers:
+            if breaker.state != CLOSED:
+                state_metrics.add_metric([breaker.target], breaker.state)
+
+        yield state_metrics
+
+_circuit_breakers = None
+_circuit_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(config, target):
+    """
+    Return the circuit breaker of the target, or None if it is disabled.
+    """
+    global _circuit_breakers
+
+    breaker_config = config.get("circuit_breaker") or {}
+    if not breaker_config.get("enabled", False):
+        return None
+
+    with _circuit_breakers_lock:
+        if _circuit_breakers is None:
+            _circuit_breakers = CircuitBreakers(breaker_config)
+            REGISTRY.register(_circuit_breakers)
+
+    return _circuit_breakers.get(target)
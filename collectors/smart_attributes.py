@@ -0,0 +1,189 @@
+from collections import namedtuple
+
+import logging
+import re
+import threading
+
+# SmartData keys are matched against the patterns of a media type in order and
+# the first matching pattern names the attribute, the metrics are then added
+# in the order of their list
+SmartMatcher = namedtuple("SmartMatcher", ["attribute", "pattern"])
+SmartMetric = namedtuple("SmartMetric", ["attribute", "metric", "parser"])
+
+def parse_integer(value):
+    return int(value) if value and value.isdigit() else None
+
+def parse_digits(value):
+    digits = ''.join(filter(str.isdigit, value))
+    return float(digits) if digits else None
+
+def parse_percent(value):
+    # the value ends with a percent sign, e.g. "3%"
+    return int(value[:-1]) if value and value[:-1].isdigit() else None
+
+VALUE_PARSERS = {
+    "integer": parse_integer,
+    "digits": parse_digits,
+    "percent": parse_percent,
+}
+
+BUILTIN_MEDIA_TYPES = {
+    "nvme": {
+        "info_host": True,
+        "match": [
+            ["available_spare", "^(?!.*threshold).*spare"],
+            ["available_spare_threshold", "spare"],
+            ["controller_busy_time", "controller"],
+            ["error_information_log_entries", "information"],
+            ["firmware_version", "firmware"],
+            ["host_write", "write"],
+            ["host_read", "read"],
+            ["power_on_hours", "hours"],
+            ["unsafe_shutdowns", "shutdowns"],
+            ["temperature", "[Tt]emperature"],
+            ["power_cycles_count", "Cycle|cycles"],
+            ["percentage_used", "[Pp]ercentage"],
+            ["media_errors", "[Mm]edia"],
+        ],
+        "metrics": [
+            ["temperature", "smartmon_temperature_celsius_raw_value", "digits"],
+            ["power_cycles_count", "smartmon_power_cycle_count_raw_value", "integer"],
+            ["power_on_hours", "smartmon_power_on_hours_raw_value", "integer"],
+            ["percentage_used", "smartmon_percentage_used_raw_value", "percent"],
+            ["media_errors", "smartmon_media_and_data_integrity_errors_count_raw_value", "integer"],
+            ["unsafe_shutdowns", "smartmon_unsafe_shutdowns_count_raw_value", "integer"],
+            ["error_information_log_entries", "smartmon_error_information_log_entries_raw_value", "integer"],
+            ["host_read", "smartmon_host_read_commands_raw_value", "integer"],
+            ["host_write", "smartmon_host_write_commands_raw_value", "integer"],
+            ["controller_busy_time", "smartmon_controller_busy_time_raw_value", "integer"],
+            ["available_spare", "smartmon_available_spare_raw_value", "integer"],
+            ["available_spare_threshold", "smartmon_available_spare_threshold_raw_value", "integer"],
+        ],
+    },
+    "sas": {
+        "info_host": False,
+        "match": [
+            ["grown_defects_count", "defects"],
+            ["power_on_hours", "hours"],
+            ["temperature", "[Tt]emperature"],
+            ["power_cycles_count", "Cycle|cycles"],
+            ["percentage_used", "[Pp]ercentage"],
+        ],
+        "metrics": [
+            ["temperature", "smartmon_temperature_celsius_raw_value", "digits"],
+            ["power_cycles_count", "smartmon_power_cycle_count_raw_value", "integer"],
+            ["power_on_hours", "smartmon_power_on_hours_raw_value", "integer"],
+            ["percentage_used", "smartmon_percentage_used_raw_value", "integer"],
+            ["grown_defects_count", "smartmon_grown_defects_count_raw_value", "integer"],
+        ],
+    },
+}
+
+class SmartTable(object):
+    """
+    The SmartData attributes and metrics of one drive media type.
+    """
+
+    def __init__(self, media_type, match, metrics, info_host=True):
+        self.media_type = media_type
+        self.info_host = info_host
+        self.matchers = [SmartMatcher(attribute, re.compile(pattern)) for attribute, pattern in match]
+        self.metrics = []
+        for attribute, metric, parser in metrics:
+            if parser not in VALUE_PARSERS:
+                raise ValueError(f"unknown value parser {parser} of {metric}, use one of {', '.join(VALUE_PARSERS)}")
+            self.metrics.append(SmartMetric(attribute, metric, VALUE_PARSERS[parser]))
+
+        # the drives of a BMC use the same keys, so most keys are matched once
+        self._attribute_of_key = {}
+        self.max_cached_keys = 4096
+
+    def attribute_of(self, key):
+        try:
+            return self._attribute_of_key[key]
+        except KeyError:
+            pass
+
+        attribute = None
+        for matcher in self.matchers:
+            if matcher.pattern.search(key):
+                attribute = matcher.attribute
+                break
+
+        # keys with the device name are different for every drive
+        if len(self._attribute_of_key) >= self.max_cached_keys:
+            self._attribute_of_key = {}
+        self._attribute_of_key[key] = attribute
+        return attribute
+
+    def attributes(self, smart_data):
+        """
+        Return the lower case SmartData values by attribute, a later key
+        overwrites the value of an earlier key of the same attribute.
+        """
+        attributes = {}
+        for key, value in smart_data.items():
+            attribute = self.attribute_of(key)
+            if attribute:
+                attributes[attribute] = str(value).lower()
+
+        return attributes
+
+    def samples(self, smart_data):
+        """
+        Return the (metric, value) samples of the SmartData.
+        """
+        attributes = self.attributes(smart_data)
+        samples = []
+        for smart_metric in self.metrics:
+            value = smart_metric.parser(attributes.get(smart_metric.attribute, ""))
+            if value is not None:
+                samples.append((smart_metric.metric, value))
+
+        return samples
+
+def build_smart_tables(media_types):
+    """
+    Return the SMART tables of the media types, an invalid media type is
+    logged and skipped.
+    """
+    tables = {}
+    for media_type, table in media_types.items():
+        try:
+            tables[media_type.lower()] = SmartTable(
+                media_type.lower(),
+                table["match"],
+                table["metrics"],
+                table.get("info_host", True)
+            )
+        except KeyError as err:
+            logging.error("Skipping the SMART media type %s of smart_media_types without %s", media_type, err)
+        except (AttributeError, TypeError, ValueError, re.error) as err:
+            logging.error("Skipping the invalid SMART media type %s of smart_media_types: %s", media_type, err)
+
+    return tables
+
+SMART_TABLES = build_smart_tables(BUILTIN_MEDIA_TYPES)
+
+_smart_tables = None
+_smart_tables_lock = threading.Lock()
+
+def get_smart_tables(config):
+    """
+    Return the SMART tables by media type, the built-in NVMe and SAS tables
+    extended or replaced by the media types of the smart_media_types setting.
+    """
+    global _smart_tables
+
+    configured = config.get("smart_media_types") or {}
+    if not configured:
+        return SMART_TABLES
+
+    with _smart_tables_lock:
+        if _smart_tables is None:
+            media_types = dict(BUILTIN_MEDIA_TYPES)
+            media_types.update(configured)
+            _smart_tables = build_smart_tables(media_types)
+            logging.info("SMART data is collected for media types %s", ", ".join(_smart_tables))
+
+    return _smart_tables
@@ -0,0 +1,150 @@
+from collections import OrderedDict
+
+import logging
+import os
+import socket
+import threading
+import time
+
+from exporter_metrics import DNS_CACHE_LOOKUPS
+
+class DNSCacheEntry(object):
+
+    def __init__(self, result, error, expires):
+        self.result = result
+        self.error = error
+        self.expires = expires
+
+class DNSCache(object):
+    """
+    Forward and reverse DNS cache for the targets.
+
+    Successful lookups are cached for ttl seconds, failed ones for
+    negative_ttl seconds. If a lookup fails after a successful one expired,
+    the expired result is used instead of failing the scrape. Both caches
+    hold at most max_size entries and drop the least recently used first.
+    """
+
+    def __init__(self, ttl, negative_ttl, max_size):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+
+        self._caches = {"forward": OrderedDict(), "reverse": OrderedDict()}
+        self._lock = threading.Lock()
+
+    def _store(self, kind, key, result, error, ttl):
+        with self._lock:
+            cache = self._caches[kind]
+            cache[key] = DNSCacheEntry(result, error, time.monotonic() + ttl)
+            cache.move_to_end(key)
+            while len(cache) > self.max_size:
+                cache.popitem(last=False)
+
+    def _lookup(self, kind, key, resolve, errors):
+        with self._lock:
+            entry = self._caches[kind].get(key)
+            if entry:
+                self._caches[kind].move_to_end(key)
+
+        if entry and entry.expires > time.monotonic():
+            if entry.error:
+                DNS_CACHE_LOOKUPS.labels(kind, "negative_hit").inc()
+                # a new exception per scrape, raising the cached one would
+                # chain the tracebacks of all scrapes that raised it before
+                raise type(entry.error)(*entry.error.args)
+            DNS_CACHE_LOOKUPS.labels(kind, "hit").inc()
+            return entry.result
+
+        DNS_CACHE_LOOKUPS.labels(kind, "miss").inc()
+        try:
+            result = resolve(key)
+
+        except errors as err:
+            if entry and not entry.error:
+                logging.warning("Target %s: DNS lookup failed: %s. Using the expired result.", key, err)
+                DNS_CACHE_LOOKUPS.labels(kind, "stale").inc()
+                self._store(kind, key, entry.result, None, self.negative_ttl)
+                return entry.result
+
+            self._store(kind, key, None, err, self.negative_ttl)
+            raise
+
+        self._store(kind, key, result, None, self.ttl)
+        return result
+
+    def gethostbyname(self, host):
+        """
+        Cached socket.gethostbyname, raises socket.gaierror.
+        """
+        return self._lookup("forward", host, socket.gethostbyname, socket.gaierror)
+
+    def gethostbyaddr(self, address):
+        """
+        Cached socket.gethostbyaddr, raises socket.herror.
+        """
+        return self._lookup("reverse", address, socket.gethostbyaddr, (socket.herror, socket.gaierror))
+
+    def load_hosts_file(self, filename):
+        """
+        Pre-warm the cache from a hosts style file with lines "address name [alias ...]".
+        """
+        count = 0
+        with open(filename, "r", encoding="utf8") as hosts_file:
+            for line in hosts_file:
+                fields = line.split("#")[0].split()
+                if len(fields) < 2:
+                    continue
+
+                address, names = fields[0], fields[1:]
+                for name in names:
+                    self._store("forward", name, address, None, self.ttl)
+                self._store("reverse", address, (names[0], names[1:], [address]), None, self.ttl)
+                count += 1
+
+        logging.info("Loaded %s DNS entries from %s", count, filename)
+
+    def prewarm(self, targets):
+        """
+        Resolve the targets in the background.
+        """
+        def resolve_targets():
+            for target in targets:
+                try:
+                    address = self.gethostbyname(target)
+                    self.gethostbyaddr(address)
+                except (socket.herror, socket.gaierror) as err:
+                    logging.debug("Target %s: DNS pre-warming failed: %s", target, err)
+
+        threading.Thread(target=resolve_targets, name="dns-prewarm", daemon=True).start()
+
+_dns_cache = None
+_dns_cache_lock = threading.Lock()
+
+def get_dns_cache(config):
+    """
+    Return the process wide DNS cache, or None if caching is disabled.
+    """
+    global _dns_cache
+
+    dns_config = config.get("dns_cache") or {}
+    ttl = int(os.getenv("DNS_CACHE_TTL", dns_config.get("ttl", 300)))
+    if ttl <= 0:
+        return None
+
+    with _dns_cache_lock:
+        if _dns_cache is None:
+            _dns_cache = DNSCache(
+                ttl = ttl,
+                negative_ttl = int(dns_config.get("negative_ttl", 30)),
+                max_size = int(dns_config.get("max_size", 4096))
+            )
+
+            hosts_file = dns_config.get("hosts_file")
+            if hosts_file:
+                try:
+                    _dns_cache.load_hosts_file(hosts_file)
+                except OSError as err:
+                    logging.error("Could not load DNS hosts file %s: %s", hosts_file, err)
+
+    return _dns_cache
@@ -0,0 +1,157 @@
+from collections import OrderedDict, namedtuple
+from prometheus_client.core import GaugeMetricFamily
+
+import logging
+import threading
+import time
+
+from exporter_metrics import REGISTRY
+from json_decoder import RESOURCE_FIELDS
+
+STRATEGIES = ["expand", "index", "walk"]
+
+# HTTP codes of a BMC that does not understand the query
+UNSUPPORTED_CODES = [400, 403, 404, 405, 501]
+
+# the expand query of a BMC, see ExpandQuery.capabilities
+ExpandCapabilities = namedtuple("ExpandCapabilities", ["expand", "levels", "select"])
+
+def select_paths(fields, prefix=""):
+    """
+    Return the $select paths of the fields of RESOURCE_FIELDS, e.g. Oem/SmartData.
+    """
+    paths = []
+    for field, nested_fields in fields.items():
+        if field.startswith("@odata."):
+            continue
+        if nested_fields is None:
+            paths.append(prefix + field)
+        else:
+            paths.extend(select_paths(nested_fields, f"{prefix}{field}/"))
+
+    return paths
+
+# a BMC may apply $select to the collections and capacity sources of the
+# expanded response as well, so their links are selected too
+SELECT_PATHS = ["Members", "ProvidingDrives"] + select_paths(RESOURCE_FIELDS["drive"])
+
+class ExpandQuery(object):
+    """
+    Fetch the capacity sources of a storage pool together with their
+    providing drives in one request, with the $expand and $select query
+    parameters of the BMCs announcing them in the ProtocolFeaturesSupported
+    of the service root.
+
+    A target whose BMC answered an expand query with an error or without the
+    expanded resources is walked member by member again, and only tried
+    again after retry_interval seconds.
+    """
+
+    def __init__(self, max_levels=3, select=True, retry_interval=3600, max_targets=4096):
+        self.max_levels = max_levels
+        self.select = select
+        self.retry_interval = retry_interval
+        self.max_targets = max_targets
+
+        self._unsupported = {}
+        self._strategies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def capabilities(self, target, service_root):
+        """
+        Return the ExpandCapabilities of the BMC, or None if its expand query
+        cannot return the providing drives of a capacity source collection.
+        """
+        features = service_root.get("ProtocolFeaturesSupported") if isinstance(service_root, dict) else None
+        if not isinstance(features, dict):
+            return None
+
+        expand_query = features.get("ExpandQuery") or {}
+        if expand_query.get("ExpandAll"):
+            # the providing drives are links to the drives of a chassis
+            expand = "*"
+        elif expand_query.get("NoLinks"):
+            expand = "."
+        else:
+            return None
+
+        # the members of the collection and their providing drives
+        levels = min(self.max_levels, int(expand_query.get("MaxLevels", 1) if expand_query.get("Levels") else 1))
+        if levels < 2:
+            return None
+
+        return ExpandCapabilities(expand, levels, self.select and bool(features.get("SelectQuery")))
+
+    def url(self, url, capabilities):
+        query = f"$expand={capabilities.expand}($levels={capabilities.levels})"
+        if capabilities.select:
+            query += "&$select=" + ",".join(SELECT_PATHS)
+        return f"{url}?{query}"
+
+    def usable(self, target):
+        with self._lock:
+            retry_at = self._unsupported.get(target)
+            if retry_at is None:
+                return True
+            if time.monotonic() < retry_at:
+                return False
+            del self._unsupported[target]
+
+        logging.info("Target %s: Trying the expand query again", target)
+        return True
+
+    def unsupported(self, target, reason):
+        logging.info(
+            "Target %s: Expand query not usable (%s), walking the storage tree for %s seconds",
+            target, reason, self.retry_interval
+        )
+        with self._lock:
+            self._unsupported[target] = time.monotonic() + self.retry_interval
+            while len(self._unsupported) > self.max_targets:
+                self._unsupported.pop(next(iter(self._unsupported)))
+
+    def record(self, target, strategy):
+        with self._lock:
+            self._strategies[target] = strategy
+            self._strategies.move_to_end(target)
+            while len(self._strategies) > self.max_targets:
+                self._strategies.popitem(last=False)
+
+    def collect(self):
+        with self._lock:
+            strategies = list(self._strategies.items())
+
+        strategy_metrics = GaugeMetricFamily(
+            "redfish_exporter_storage_strategy",
+            "Strategy the last scrape of the target fetched its drives with (expand, index or walk)",
+            labels = ["target", "strategy"],
+        )
+        for target, strategy in strategies:
+            for name in STRATEGIES:
+                strategy_metrics.add_metric([target, name], 1 if name == strategy else 0)
+
+        yield strategy_metrics
+
+_expand_query = None
+_expand_query_lock = threading.Lock()
+
+def get_expand_query(config):
+    """
+    Return the expand query support, or None if it is disabled.
+    """
+    global _expand_query
+
+    expand_config = config.get("expand_query") or {}
+    if not expand_config.get("enabled", False):
+        return None
+
+    with _expand_query_lock:
+        if _expand_query is None:
+            _expand_query = ExpandQuery(
+                max_levels = int(expand_config.get("max_levels", 3)),
+                select = bool(expand_config.get("select", True)),
+                retry_interval = float(expand_config.get("retry_interval", 3600))
+            )
+            REGISTRY.register(_expand_query)
+
+    return _expand_query
@@ -0,0 +1,192 @@
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client import GCCollector, PlatformCollector, ProcessCollector
+
+import re
+import threading
+
+# metrics about the exporter itself, served on /metrics
+REGISTRY = CollectorRegistry(auto_describe=True)
+
+# CPU, memory, open files, Python version and garbage collections of the process
+ProcessCollector(registry=REGISTRY)
+PlatformCollector(registry=REGISTRY)
+GCCollector(registry=REGISTRY)
+
+SCRAPE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+SCRAPE_DURATION = Histogram(
+    "redfish_exporter_scrape_duration_seconds",
+    "Duration of the scrapes of the exporter by metrics type and outcome (collected, cached, error)",
+    ["metrics_type", "outcome"],
+    buckets = SCRAPE_BUCKETS,
+    registry = REGISTRY,
+)
+
+COLLECTION_DURATION = Histogram(
+    "redfish_exporter_collection_duration_seconds",
+    "Duration of the collections from the BMCs by metrics type and outcome (up, down, partial, error)",
+    ["metrics_type", "outcome"],
+    buckets = SCRAPE_BUCKETS,
+    registry = REGISTRY,
+)
+
+SCRAPES_IN_FLIGHT = Gauge(
+    "redfish_exporter_scrapes_in_flight",
+    "Scrapes of the exporter in progress",
+    ["metrics_type"],
+    registry = REGISTRY,
+)
+
+COLLECTIONS_IN_FLIGHT = Gauge(
+    "redfish_exporter_collections_in_flight",
+    "Collections from the BMCs in progress, concurrent scrapes of a target share one collection",
+    ["metrics_type"],
+    registry = REGISTRY,
+)
+
+THREADS = Gauge(
+    "redfish_exporter_threads",
+    "Threads of the exporter process",
+    registry = REGISTRY,
+)
+THREADS.set_function(threading.active_count)
+
+SERVER_QUEUE_LENGTH = Gauge(
+    "redfish_exporter_server_queue_length",
+    "Connections waiting in the admission queue of the pool server backend",
+    registry = REGISTRY,
+)
+
+SERVER_QUEUE_WAIT = Histogram(
+    "redfish_exporter_server_queue_wait_seconds",
+    "Time the connections waited in the admission queue of the pool server backend",
+    buckets = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    registry = REGISTRY,
+)
+
+SERVER_REJECTED = Counter(
+    "redfish_exporter_server_rejected_total",
+    "Connections answered with 503 because the admission queue was full",
+    registry = REGISTRY,
+)
+
+DNS_CACHE_LOOKUPS = Counter(
+    "redfish_exporter_dns_cache_lookups_total",
+    "DNS cache lookups of targets by kind (forward, reverse) and result (hit, miss, negative_hit, stale)",
+    ["kind", "result"],
+    registry = REGISTRY,
+)
+
+RESOURCE_CACHE_LOOKUPS = Counter(
+    "redfish_exporter_resource_cache_lookups_total",
+    "Redfish resource cache lookups by resource kind and result (hit, miss, not_modified)",
+    ["kind", "result"],
+    registry = REGISTRY,
+)
+
+BMC_REQUEST_DURATION = Histogram(
+    "redfish_exporter_bmc_request_duration_seconds",
+    "Duration of the Redfish requests to the BMCs by target class, resource kind and method",
+    ["target_class", "kind", "method"],
+    buckets = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+    registry = REGISTRY,
+)
+
+BMC_RESPONSES = Counter(
+    "redfish_exporter_bmc_responses_total",
+    "Redfish responses of the BMCs by status code, 408 and 444 are timeouts and connection errors",
+    ["target_class", "kind", "method", "code"],
+    registry = REGISTRY,
+)
+
+BMC_RESPONSE_BYTES = Counter(
+    "redfish_exporter_bmc_response_bytes_total",
+    "Bytes received in Redfish response bodies",
+    ["target_class", "kind", "method"],
+    registry = REGISTRY,
+)
+
+BMC_ERRORS = Counter(
+    "redfish_exporter_bmc_errors_total",
+    "Failed Redfish requests by target class and error class (timeout, connection, deadline, auth, client, server, other)",
+    ["target_class", "error"],
+    registry = REGISTRY,
+)
+
+def bmc_error_class(code):
+    """
+    Return the error class of a response code, or None for a successful response.
+    """
+    if code == "408":
+        return "timeout"
+    if code == "444":
+        return "connection"
+    if code == "deadline":
+        return "deadline"
+    if code in ("401", "403"):
+        return "auth"
+    if code.startswith("4"):
+        return "client"
+    if code.startswith("5"):
+        return "server"
+    if code.isdigit():
+        return None
+
+    return "other"
+
+def target_class(config, target, host):
+    """
+    Return the name of the first target class whose pattern matches the
+    target or its host name, target classes are used as metric labels
+    instead of the targets to keep the number of time series bounded.
+    """
+    for name, pattern in (config.get("target_classes") or {}).items():
+        if re.search(pattern, target) or (host and re.search(pattern, host)):
+            return name
+
+    return "default"
+
+def observe_bmc_request(target_class, kind, method, code, duration, size):
+    BMC_REQUEST_DURATION.labels(target_class, kind, method).observe(duration)
+    BMC_RESPONSES.labels(target_class, kind, method, code).inc()
+    if size:
+        BMC_RESPONSE_BYTES.labels(target_class, kind, method).inc(size)
+
+    error = bmc_error_class(code)
+    if error:
+        BMC_ERRORS.labels(target_class, error).inc()
+
+COALESCED_COLLECTIONS = Counter(
+    "redfish_exporter_coalesced_collections_total",
+    "Scrapes answered with the result of a running or just finished collection of the same target",
+    ["metrics_type"],
+    registry = REGISTRY,
+)
+
+BMC_THROTTLED = Counter(
+    "redfish_exporter_bmc_throttled_total",
+    "Redfish requests delayed by the rate limit or the concurrency limit of their BMC",
+    ["target_class", "reason"],
+    registry = REGISTRY,
+)
+
+BMC_BACKOFFS = Counter(
+    "redfish_exporter_bmc_backoffs_total",
+    "Redfish requests that made the concurrency limit of their BMC back off",
+    ["target_class", "reason"],
+    registry = REGISTRY,
+)
+
+BMC_LIMITER_TIMEOUTS = Counter(
+    "redfish_exporter_bmc_limiter_timeouts_total",
+    "Redfish requests not sent because they waited for the limits of their BMC longer than the connect timeout or the scrape deadline",
+    ["target_class"],
+    registry = REGISTRY,
+)
+
+CIRCUIT_OPEN_SCRAPES = Counter(
+    "redfish_exporter_circuit_open_scrapes_total",
+    "Scrapes answered with redfish_up 0 without connecting because the circuit of the target was open",
+    ["target_class"],
+    registry = REGISTRY,
+)
@@ -0,0 +1,51 @@
+from prometheus_client.exposition import generate_latest
+from prometheus_client.utils import floatToGoString
+
+from sample_buffer import SampleBuffer
+
+class MetricFamilyRegistry(object):
+
+    def __init__(self, metric_family):
+        self.metric_family = metric_family
+
+    def collect(self):
+        yield self.metric_family
+
+def render_family(family, header=True):
+    """
+    Return the exposition text of a metric family in the format of
+    generate_latest, without the "# HELP" and "# TYPE" lines if header is
+    False. A SampleBuffer is rendered from its pre-rendered label sets.
+    """
+    if not isinstance(family, SampleBuffer):
+        text = generate_latest(MetricFamilyRegistry(family))
+        return text if header else text.split(b"\n", 2)[2]
+
+    lines = []
+    if header:
+        documentation = family.documentation.replace("\\", r"\\").replace("\n", r"\n")
+        lines.append(f"# HELP {family.name} {documentation}\n# TYPE {family.name} {family.type}\n")
+    for name, label_set, value in family.samples:
+        lines.append(f"{name}{label_set.rendered} {floatToGoString(value)}\n")
+
+    return "".join(lines).encode("utf-8")
+
+def stream_latest(collector):
+    """
+    Yield the exposition text of a RedfishMetricsCollector chunk by chunk, in
+    the same format as generate_latest. Consecutive chunks of the same gauge
+    family share one HELP and TYPE header.
+    """
+    previous_name = None
+    for chunk in collector.collect_chunks():
+        text = render_family(chunk, header=not (chunk.name == previous_name and chunk.type == "gauge"))
+
+        previous_name = chunk.name
+        if text:
+            yield text
+
+def render_latest(collector):
+    """
+    Return the exposition text of a RedfishMetricsCollector like generate_latest.
+    """
+    return b"".join(stream_latest(collector))
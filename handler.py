@@ -3,12 +3,22 @@ import logging
 import socket
 import re
 import os
+import time
 import traceback
 
 from prometheus_client.exposition import CONTENT_TYPE_LATEST
 from prometheus_client.exposition import generate_latest
 
+from async_engine import AsyncRedfishMetricsCollector
 from collector import RedfishMetricsCollector
+from collectors.smart_attributes import get_smart_tables
+from dns_cache import get_dns_cache
+from exporter_metrics import REGISTRY, COLLECTION_DURATION, COLLECTIONS_IN_FLIGHT, SCRAPE_DURATION, SCRAPES_IN_FLIGHT
+from exposition import render_latest, stream_latest
+from process_pool import CollectionProcessPool
+from scheduler import ScrapeScheduler
+from session_pool import get_session_pool
+from singleflight import SingleFlight
 
 class welcomePage:
     def on_get(self, req, resp):
@@ -23,28 +33,83 @@ class metricsHandler:
     def __init__(self, config, metrics_type):
         self._config = config
         self.metrics_type = metrics_type
+        self._session_pool = get_session_pool(config)
+        self._dns_cache = get_dns_cache(config)
 
-    def on_get(self, req, resp):
-        target = req.get_param("target")
-        if not target:
-            logging.error("No target parameter provided!")
-            raise falcon.HTTPMissingParam("target")
+        # invalid media types of smart_media_types are reported at startup
+        get_smart_tables(config)
+
+        self._collector_class = RedfishMetricsCollector
+        if os.getenv("ENGINE", config.get("engine", "threads")) == "async":
+            self._collector_class = AsyncRedfishMetricsCollector
+
+        # write the metrics while they are collected instead of after the scrape
+        self._stream = bool(config.get("stream_response", False))
+
+        # seconds a collection may take without a Prometheus scrape timeout, 0
+        # for no limit, and the seconds kept to write the response in time
+        self._scrape_deadline = float(config.get("scrape_deadline", 0))
+        self._deadline_margin = float(config.get("deadline_margin", 0.5))
+
+        # concurrent scrapes of a target share one collection
+        self._singleflight = None
+        coalesce_config = config.get("coalesce") or {}
+        if coalesce_config.get("enabled", True):
+            self._singleflight = SingleFlight(
+                grace = float(coalesce_config.get("grace", 0)),
+                wait_timeout = float(coalesce_config.get("wait_timeout", 300))
+            )
+
+        # collect in worker processes, every target always in the same one
+        self._process_pool = None
+        processes = int(os.getenv("COLLECTION_PROCESSES", config.get("collection_processes", 0)))
+        if processes > 0:
+            self._process_pool = CollectionProcessPool(
+                config,
+                metrics_type,
+                processes,
+                threads = int(config.get("collection_threads", 16))
+            )
 
-        logging.debug(f"Received Target %s for metrics type: %s", target, self.metrics_type)
+        self._scheduler = None
+        scheduler_config = config.get("scheduler") or {}
+        if scheduler_config.get("enabled"):
+            self._scheduler = ScrapeScheduler(scheduler_config, self.metrics_type, self.collect_once, self.resolve_target)
 
+    def start(self):
+        if self._scheduler:
+            if self._dns_cache:
+                self._dns_cache.prewarm(list(self._scheduler.targets))
+            self._scheduler.start()
+
+    def stop(self):
+        if self._scheduler:
+            self._scheduler.stop()
+        if self._process_pool:
+            self._process_pool.close()
+
+    def worker_metrics(self):
+        """
+        Return the metric families of the exporter in the collection worker
+        processes, if there are any.
+        """
+        if not self._process_pool:
+            return []
+        return self._process_pool.collect_metrics()
+
+    def resolve_target(self, target):
         ip_re = re.compile(
             r"^(([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.){3}"
             r"([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])$"
         )
 
-        resp.set_header("Content-Type", CONTENT_TYPE_LATEST)
-        
         host = None
+        resolver = self._dns_cache or socket
 
         if ip_re.match(target):
             logging.debug("Target %s: Target is an IP Address.", target)
             try:
-                host = socket.gethostbyaddr(target)[0]
+                host = resolver.gethostbyaddr(target)[0]
             except socket.herror as err:
                 logging.warning("Target %s: Reverse DNS lookup failed: %s. Using IP address as host.", target, err)
                 host = target
@@ -52,38 +117,248 @@ class metricsHandler:
             logging.debug("Target %s: Target is a hostname.", target)
             host = target
             try:
-                target = socket.gethostbyname(host)
+                target = resolver.gethostbyname(host)
             except socket.gaierror as err:
                 msg = f"Target {target}: DNS lookup failed: {err}"
                 logging.error(msg)
                 raise falcon.HTTPInvalidParam(msg, "target")
 
+        return target, host
+
+    def deadline(self, scrape_timeout=None):
+        """
+        Return the time.monotonic() a collection has to be finished by, or
+        None if it is not limited.
+        """
+        if scrape_timeout:
+            return time.monotonic() + max(0, scrape_timeout - self._deadline_margin)
+        if self._scrape_deadline > 0:
+            return time.monotonic() + self._scrape_deadline
+        return None
+
+    def new_collector(self, target, scrape_timeout=None):
+        """
+        Resolve the target and return a collector for it.
+        """
+        deadline = self.deadline(scrape_timeout)
+        target, host = self.resolve_target(target)
+
         usr = self._config.get("username")
         pwd = self._config.get("password")
         rf_port = self._config.get("rf_port")
 
         logging.debug("Target %s: Using user %s with port %s", target, usr, rf_port)
 
-        with RedfishMetricsCollector(
+        return self._collector_class(
             self._config,
             target = target,
             host = host,
             usr = usr,
             pwd = pwd, 
             rf_port = rf_port,
-            metrics_type = self.metrics_type
-        ) as registry:
-            
-            registry.get_session()
+            metrics_type = self.metrics_type,
+            session_pool = self._session_pool,
+            deadline = deadline
+        )
+
+    def collect(self, target, scrape_timeout=None):
+        """
+        Resolve the target, collect its metrics and return the exposition text.
+        """
+        if self._process_pool:
+            return self._process_pool.collect(target, scrape_timeout)
+
+        start_time = time.time()
+        COLLECTIONS_IN_FLIGHT.labels(self.metrics_type).inc()
+        outcome = "error"
+        try:
+            with self.new_collector(target, scrape_timeout) as registry:
+
+                registry.get_session()
 
-            try:
                 # collect the actual metrics
                 logging.debug("Target %s: Collecting %s metrics", target, self.metrics_type)
-                resp.text = generate_latest(registry)
+                text = render_latest(registry)
+                outcome = registry.collection_outcome()
+                return text
+
+        finally:
+            self.collection_finished(start_time, outcome)
+
+    def collection_finished(self, start_time, outcome):
+        COLLECTIONS_IN_FLIGHT.labels(self.metrics_type).dec()
+        COLLECTION_DURATION.labels(self.metrics_type, outcome).observe(time.time() - start_time)
+
+    def collect_once(self, target, scrape_timeout=None):
+        """
+        Like collect, but concurrent calls for the same target share one collection.
+        """
+        if not self._singleflight:
+            return self.collect(target, scrape_timeout)
+
+        return self._singleflight.do(
+            (target, self.metrics_type), lambda: self.collect(target, scrape_timeout), self.deadline(scrape_timeout)
+        )
+
+    def open_stream(self, target, scrape_timeout=None):
+        """
+        Connect to the target and return a generator of its exposition text,
+        or the text of a running collection of the target. Errors before the
+        first byte is written are raised here, later ones end the stream early.
+        """
+        key = (target, self.metrics_type)
+        flight = None
+        if self._singleflight:
+            flight, leader = self._singleflight.join(key)
+            if not leader:
+                return [self._singleflight.wait(
+                    key, flight, lambda: self.collect(target, scrape_timeout), self.deadline(scrape_timeout)
+                )]
+
+        start_time = time.time()
+        COLLECTIONS_IN_FLIGHT.labels(self.metrics_type).inc()
+        try:
+            registry = self.new_collector(target, scrape_timeout).__enter__()
+            try:
+                registry.get_session()
+            except BaseException:
+                registry.__exit__(None, None, None)
+                raise
+
+        except BaseException as err:
+            self.collection_finished(start_time, "error")
+            if flight:
+                self._singleflight.complete(key, flight, error=err)
+            raise
+
+        return self.stream(target, registry, flight, start_time)
+
+    def stream(self, target, registry, flight=None, start_time=None):
+        key = (target, self.metrics_type)
+        chunks = []
+        text = None
+        try:
+            logging.debug("Target %s: Streaming %s metrics", target, self.metrics_type)
+            for chunk in stream_latest(registry):
+                if self._scheduler or flight:
+                    chunks.append(chunk)
+                yield chunk
+            text = b"".join(chunks)
+
+        except Exception:
+            logging.error("Target %s: Metrics stream aborted: %s", target, traceback.format_exc())
+            return
+
+        finally:
+            registry.__exit__(None, None, None)
+            self.collection_finished(start_time, "error" if text is None else registry.collection_outcome())
+            if flight and text is None:
+                self._singleflight.complete(key, flight, error=RuntimeError(f"Target {target}: Metrics stream aborted"))
+            elif flight:
+                self._singleflight.complete(key, flight, result=text)
+
+        if self._scheduler:
+            self._scheduler.store(target, text)
+
+    def on_get(self, req, resp):
+        start_time = time.time()
+        SCRAPES_IN_FLIGHT.labels(self.metrics_type).inc()
+        outcome = "error"
+        try:
+            outcome = self.respond(req, resp)
+        finally:
+            if outcome == "streamed":
+                resp.stream = self.finish_stream(resp.stream, start_time)
+            else:
+                self.scrape_finished(start_time, outcome)
+
+    def scrape_finished(self, start_time, outcome):
+        SCRAPES_IN_FLIGHT.labels(self.metrics_type).dec()
+        SCRAPE_DURATION.labels(self.metrics_type, outcome).observe(time.time() - start_time)
+
+    def finish_stream(self, chunks, start_time):
+        try:
+            yield from chunks
+        finally:
+            self.scrape_finished(start_time, "collected")
+
+    def respond(self, req, resp):
+        """
+        Answer a scrape and return whether the metrics were cached, streamed or collected.
+        """
+        target = req.get_param("target")
+        if not target:
+            logging.error("No target parameter provided!")
+            raise falcon.HTTPMissingParam("target")
+
+        logging.debug("Received Target %s for metrics type: %s", target, self.metrics_type)
+
+        resp.set_header("Content-Type", CONTENT_TYPE_LATEST)
+
+        # Prometheus sends its scrape timeout, the collection ends before it
+        scrape_timeout = None
+        try:
+            scrape_timeout = float(req.get_header("X-Prometheus-Scrape-Timeout-Seconds") or 0)
+        except ValueError:
+            logging.warning("Target %s: Ignoring invalid scrape timeout header", target)
+
+        if self._scheduler:
+            cached = self._scheduler.get(target)
+            if cached is not None:
+                logging.debug("Target %s: Serving cached %s metrics", target, self.metrics_type)
+                resp.text = cached
                 resp.status = falcon.HTTP_200
-                logging.debug("Target %s: Successfully generated %s metrics", target, self.metrics_type)
+                return "cached"
+
+        try:
+            # the worker processes send the whole text
+            if self._stream and not self._process_pool:
+                resp.stream = self.open_stream(target, scrape_timeout)
+                resp.status = falcon.HTTP_200
+                return "streamed"
+
+            resp.text = self.collect_once(target, scrape_timeout)
+            resp.status = falcon.HTTP_200
+            logging.debug("Target %s: Successfully generated %s metrics", target, self.metrics_type)
+
+        except falcon.HTTPError:
+            raise
+
+        except Exception as err:
+            message = f"Exception: {traceback.format_exc()}"
+            logging.error("Target %s: %s", target, message)
+            raise falcon.HTTPBadRequest(description=message)
 
-            except Exception as err:
-                message = f"Exception: {traceback.format_exc()}"
-                logging.error("Target %s: %s", target, message)
-                raise falcon.HTTPBadRequest(description=message)
+        if self._scheduler:
+            self._scheduler.store(target, resp.text)
+
+        return "collected"
+
+class exporterMetricsHandler:
+    """
+    Metrics about the exporter itself. With several server processes every
+    process has its own metrics and a scrape is answered by one of them.
+    The metrics of the collection worker processes of the handlers are
+    merged into the families of the server process.
+    """
+
+    def __init__(self, handlers=()):
+        self._handlers = handlers
+
+    def collect(self):
+        families = {}
+        for family in REGISTRY.collect():
+            families[family.name] = family
+        for handler in self._handlers:
+            for family in handler.worker_metrics():
+                if family.name in families:
+                    families[family.name].samples.extend(family.samples)
+                else:
+                    families[family.name] = family
+
+        return families.values()
+
+    def on_get(self, req, resp):
+        resp.set_header("Content-Type", CONTENT_TYPE_LATEST)
+        resp.text = generate_latest(self)
+        resp.status = falcon.HTTP_200
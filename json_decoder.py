@@ -0,0 +1,97 @@
+import codecs
+import json
+import logging
+import threading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# the fields the collectors read from a resource kind, None keeps the whole
+# value and a dict keeps only the listed fields of a nested object
+RESOURCE_FIELDS = {
+    "drive": {
+        "@odata.id": None,
+        "Id": None,
+        "MediaType": None,
+        "Model": None,
+        "Status": None,
+        "Oem": {"SmartData": None},
+    },
+}
+
+def loads_json(body):
+    # Redfish payloads are UTF-8, so the encoding is not detected
+    return json.loads(str(body, "utf-8"))
+
+def loads_orjson(body):
+    return orjson.loads(body)
+
+PARSERS = {"json": loads_json}
+if orjson:
+    PARSERS["orjson"] = loads_orjson
+
+def select_fields(payload, fields):
+    """
+    Return the payload with only the given fields, see RESOURCE_FIELDS.
+    """
+    if not isinstance(payload, dict):
+        return payload
+
+    selected = {}
+    for field, nested_fields in fields.items():
+        if field in payload:
+            value = payload[field]
+            selected[field] = value if nested_fields is None else select_fields(value, nested_fields)
+
+    return selected
+
+class JSONDecoder(object):
+    """
+    Decode Redfish responses with the fastest available JSON parser.
+
+    Both parsers raise a ValueError for a body that is not JSON.
+    """
+
+    def __init__(self, parser="auto", resource_fields=None):
+        if parser == "auto":
+            parser = "orjson" if orjson else "json"
+        if parser not in PARSERS:
+            logging.warning("JSON parser %s is not available, using json", parser)
+            parser = "json"
+
+        self.parser = parser
+        self._loads = PARSERS[parser]
+        self.resource_fields = resource_fields or {}
+
+    def decode(self, body):
+        if body[:3] == codecs.BOM_UTF8:
+            body = body[3:]
+        return self._loads(body)
+
+    def select(self, kind, payload):
+        """
+        Drop the fields of a decoded resource of the kind that no collector reads.
+        """
+        fields = self.resource_fields.get(kind)
+        if fields is None:
+            return payload
+        return select_fields(payload, fields)
+
+_json_decoder = None
+_json_decoder_lock = threading.Lock()
+
+def get_json_decoder(config):
+    global _json_decoder
+
+    with _json_decoder_lock:
+        if _json_decoder is None:
+            decoder_config = config.get("json_decoder") or {}
+            _json_decoder = JSONDecoder(
+                parser = decoder_config.get("parser", "auto"),
+                resource_fields = RESOURCE_FIELDS if decoder_config.get("select_fields", True) else None
+            )
+            logging.info("Decoding Redfish responses with %s", _json_decoder.parser)
+
+    return _json_decoder
@@ -1,5 +1,10 @@
+from batch import read_targets
+from batch import run_batch
+from exporter_metrics import SERVER_QUEUE_LENGTH, SERVER_QUEUE_WAIT, SERVER_REJECTED
+from handler import exporterMetricsHandler
 from handler import metricsHandler
 from handler import welcomePage
+from session_pool import get_session_pool
 
 from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
 from socketserver import ThreadingMixIn
@@ -9,6 +14,10 @@ import argparse
 import yaml
 import logging
 import os
+import queue
+import signal
+import threading
+import time
 import warnings
 import sys
 
@@ -21,18 +30,153 @@ class _SilentHandler(WSGIRequestHandler):
 class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
     """Thread per request HTTP server."""
 
+    def start_workers(self, server_config):
+        """Threads are started per request."""
+
+class PooledWSGIServer(WSGIServer):
+    """
+    HTTP server with a fixed number of worker threads.
+
+    Accepted connections wait in an admission queue of limited depth. When the
+    queue is full the connection is answered with 503 right away instead of
+    starting yet another scrape.
+    """
+
+    request_queue_size = 128
+    rejected = 0
+
+    def start_workers(self, server_config):
+        self.workers = int(os.getenv("SERVER_WORKERS", server_config.get("workers", 16)))
+        self.queue_depth = int(os.getenv("SERVER_QUEUE_DEPTH", server_config.get("queue_depth", 64)))
+        self.socket_timeout = int(server_config.get("socket_timeout", 30))
+
+        self._queue = queue.Queue(maxsize=self.queue_depth)
+        SERVER_QUEUE_LENGTH.set_function(self._queue.qsize)
+        self._threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"server-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        logging.info("Serving with %s workers and an admission queue of %s", self.workers, self.queue_depth)
+
+    def process_request(self, request, client_address):
+        try:
+            self._queue.put_nowait((request, client_address, time.monotonic()))
+        except queue.Full:
+            self.rejected += 1
+            SERVER_REJECTED.inc()
+            logging.warning("Admission queue full, rejecting request from %s", client_address[0])
+            self._reject(request)
+
+    def _reject(self, request):
+        body = b"Too many concurrent scrapes\n"
+        try:
+            # drain the request, closing a socket with unread data resets the connection
+            request.setblocking(False)
+            request.recv(65536)
+        except OSError:
+            pass
+
+        try:
+            request.setblocking(True)
+            request.settimeout(1)
+            request.sendall(
+                b"HTTP/1.0 503 Service Unavailable\r\n"
+                b"Content-Type: text/plain\r\n"
+                b"Retry-After: 1\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                b"Connection: close\r\n\r\n" + body
+            )
+        except OSError:
+            pass
+
+        self.shutdown_request(request)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            request, client_address, queued_at = item
+            SERVER_QUEUE_WAIT.observe(time.monotonic() - queued_at)
+            try:
+                request.settimeout(self.socket_timeout)
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        for _ in getattr(self, "_threads", []):
+            self._queue.put(None)
+
+SERVER_BACKENDS = {
+    "threading": ThreadingWSGIServer,
+    "pool": PooledWSGIServer,
+}
+
+def fork_processes(processes):
+    """
+    Fork processes - 1 children sharing the listen socket of the parent.
+    Returns the pids of the children in the parent and None in a child.
+    """
+    children = []
+    for _ in range(processes - 1):
+        pid = os.fork()
+        if pid == 0:
+            return None
+        children.append(pid)
+
+    return children
+
 def falcon_app(config):
     port = int(os.getenv("LISTEN_PORT", config.get("listen_port", 9200)))
     addr = "0.0.0.0"
     logging.info("Starting Redfish Prometheus Server on Port %s", port)
     logging.debug("Server configuration - Address: %s, Port: %s", addr, port)
 
-    api = falcon.API()
-    api.add_route("/health",  metricsHandler(config, metrics_type='health'))
-    api.add_route("/", welcomePage())
-    logging.debug("Added routes: /health, /")
+    server_config = config.get("server") or {}
+    backend = os.getenv("SERVER_BACKEND", server_config.get("backend", "threading"))
+    processes = int(os.getenv("SERVER_PROCESSES", server_config.get("processes", 1)))
+    if processes > 1 and (config.get("scheduler") or {}).get("enabled"):
+        logging.warning("Every server process runs its own scheduler and collects all scheduled targets")
 
-    with make_server(addr, port, api, ThreadingWSGIServer, handler_class=_SilentHandler) as httpd:
+    if backend not in SERVER_BACKENDS:
+        logging.error("Unknown server backend %s, use one of %s", backend, ", ".join(SERVER_BACKENDS))
+        sys.exit(1)
+
+    # the server thread of a scrape waits for the event loop, only the pool bounds these threads
+    if os.getenv("ENGINE", config.get("engine", "threads")) == "async" and backend == "threading":
+        logging.warning("The async engine still blocks one server thread per scrape, use the pool server backend to bound them")
+
+    # terminate cleanly, so the pooled sessions are closed and the children stopped
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    with make_server(addr, port, None, SERVER_BACKENDS[backend], handler_class=_SilentHandler) as httpd:
+        children = []
+        if processes > 1:
+            children = fork_processes(processes)
+            if children is None:
+                children = []
+            else:
+                logging.info("Started %s server processes", processes)
+
+        # threads do not survive a fork, so the handlers are created afterwards
+        health_handler = metricsHandler(config, metrics_type='health')
+        health_handler.start()
+
+        api = falcon.API()
+        api.add_route("/health",  health_handler)
+        api.add_route("/metrics", exporterMetricsHandler([health_handler]))
+        api.add_route("/", welcomePage())
+        logging.debug("Added routes: /health, /metrics, /")
+
+        httpd.set_app(api)
+        httpd.start_workers(server_config)
         httpd.daemon = True
         logging.info("Listening on Port %s", port)
         try:
@@ -40,6 +184,18 @@ def falcon_app(config):
         except (KeyboardInterrupt, SystemExit):
             logging.info("Stopping Redfish Prometheus Server")
 
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+        for pid in children:
+            os.waitpid(pid, 0)
+
+    health_handler.stop()
+
+    session_pool = get_session_pool(config)
+    if session_pool:
+        logging.info("Closing pooled Redfish sessions")
+        session_pool.close()
+
 def enable_logging(filename, debug):
     
     logger = logging.getLogger()
@@ -91,6 +247,35 @@ def get_args():
         action="store_true",
         required=False
     )
+    parser.add_argument(
+        "-t",
+        "--targets",
+        help="Collect the given targets once and exit instead of starting the server",
+        metavar="TARGET",
+        nargs="+",
+        required=False
+    )
+    parser.add_argument(
+        "-f",
+        "--targets-file",
+        help="Collect the targets listed in the file (- for stdin) once and exit",
+        metavar="FILE",
+        required=False
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="Number of targets collected concurrently in batch mode",
+        type=int,
+        required=False
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        help="Write one textfile collector .prom file per target into the directory instead of stdout",
+        metavar="DIR",
+        required=False
+    )
 
     return parser.parse_args()
 
@@ -114,4 +299,12 @@ if __name__ == "__main__":
             print(f"Config File not found: {err}")
             sys.exit(1)
 
+        if args.targets or args.targets_file:
+            targets = list(args.targets or [])
+            if args.targets_file:
+                targets.extend(read_targets(args.targets_file))
+
+            workers = args.workers or int(os.getenv("BATCH_WORKERS", configuration.get("batch_workers", 32)))
+            sys.exit(run_batch(configuration, targets, workers, args.output_dir))
+
         falcon_app(configuration)
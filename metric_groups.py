@@ -0,0 +1,109 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from prometheus_client.metrics_core import Metric
+
+import logging
+import threading
+import time
+
+from sample_buffer import SampleBuffer
+
+def copy_family(family):
+    # collect() merges the chunks of a family into the first one, so the
+    # cached families are never handed out themselves
+    if isinstance(family, SampleBuffer):
+        return family.copy()
+
+    copied = Metric(family.name, family.documentation, family.type, family.unit)
+    copied.samples = list(family.samples)
+    return copied
+
+class CachedGroup(object):
+
+    def __init__(self, families, collected_at):
+        self.families = families
+        self.collected_at = collected_at
+
+class MetricGroupCache(object):
+    """
+    The metric families of a slowly changing metric group of every target,
+    e.g. the SMART data.
+
+    A target is served the families of its last complete collection of the
+    group. When they are older than interval seconds, the scrape starts a
+    refresh in the background and is still served the old ones.
+    """
+
+    def __init__(self, group, interval, workers=4, max_targets=4096):
+        self.group = group
+        self.interval = interval
+        self.max_targets = max_targets
+
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"refresh-{group}")
+
+    def get(self, target):
+        with self._lock:
+            entry = self._entries.get(target)
+            if entry:
+                self._entries.move_to_end(target)
+            return entry
+
+    def store(self, target, families, collected_at):
+        entry = CachedGroup([copy_family(family) for family in families], collected_at)
+        with self._lock:
+            self._entries[target] = entry
+            self._entries.move_to_end(target)
+            while len(self._entries) > self.max_targets:
+                self._entries.popitem(last=False)
+
+    def expired(self, entry):
+        return time.time() - entry.collected_at >= self.interval
+
+    def refresh(self, target, collect):
+        """
+        Run collect() in the background unless a refresh of the target is
+        already running, collect() stores the new families.
+        """
+        with self._lock:
+            if target in self._refreshing:
+                return
+            self._refreshing.add(target)
+
+        logging.debug("Target %s: Refreshing the %s metrics in the background", target, self.group)
+        self._executor.submit(self._refresh, target, collect)
+
+    def _refresh(self, target, collect):
+        try:
+            collect()
+        except Exception as err:
+            logging.warning("Target %s: Refreshing the %s metrics failed: %s", target, self.group, err)
+        finally:
+            with self._lock:
+                self._refreshing.discard(target)
+
+_metric_group_caches = {}
+_metric_group_caches_lock = threading.Lock()
+
+def get_metric_group_cache(config, group):
+    """
+    Return the cache of the metric group, or None if it is collected on
+    every scrape.
+    """
+    groups_config = config.get("metric_groups") or {}
+    interval = float((groups_config.get("intervals") or {}).get(group, 0))
+    if interval <= 0:
+        return None
+
+    with _metric_group_caches_lock:
+        if group not in _metric_group_caches:
+            _metric_group_caches[group] = MetricGroupCache(
+                group,
+                interval,
+                workers = int(groups_config.get("refresh_workers", 4))
+            )
+            logging.info("Collecting the %s metrics every %s seconds", group, interval)
+
+    return _metric_group_caches[group]
@@ -0,0 +1,254 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import itertools
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+import traceback
+import warnings
+import zlib
+
+def shard_of(target, shards):
+    # crc32 is the same in every process, unlike hash()
+    return zlib.crc32(target.encode("utf-8")) % shards
+
+def worker_context():
+    """
+    Return the multiprocessing context of the workers. The front-end process
+    runs threads, so the workers are not forked from it but from a fork
+    server, which is a fresh single-threaded process, or spawned.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        # a worker started again does not import the exporter again
+        context.set_forkserver_preload(["handler"])
+        return context
+
+    return multiprocessing.get_context("spawn")
+
+def log_settings():
+    """
+    Return the log level, handlers and warning filters of the front-end
+    process, the workers do not inherit them.
+    """
+    logger = logging.getLogger()
+    handlers = []
+    for log_handler in logger.handlers:
+        fmt = log_handler.formatter._fmt if log_handler.formatter else None
+        handlers.append((getattr(log_handler, "baseFilename", None), fmt))
+
+    return logger.level, handlers, list(warnings.filters)
+
+def enable_logging(level, handlers, filters):
+    logger = logging.getLogger()
+    logger.setLevel(level)
+    for filename, fmt in handlers:
+        # the front end truncated the log file already
+        log_handler = logging.FileHandler(filename, mode="a") if filename else logging.StreamHandler()
+        log_handler.setFormatter(logging.Formatter(fmt))
+        logger.addHandler(log_handler)
+
+    warnings.filters[:] = filters
+
+def worker_main(config, metrics_type, connection, threads, log_config):
+    """
+    Collect the targets sent by the front-end process and send back their
+    exposition text, or the metrics of the exporter in the worker. The
+    worker has its own sessions and caches.
+    """
+    enable_logging(*log_config)
+
+    # imported here, the handler module imports this one
+    from exporter_metrics import REGISTRY
+    from handler import metricsHandler
+    from session_pool import get_session_pool
+
+    # the worker collects in its own threads
+    os.environ.pop("COLLECTION_PROCESSES", None)
+    handler = metricsHandler(config, metrics_type)
+    send_lock = threading.Lock()
+
+    def collect(request_id, target, scrape_timeout):
+        try:
+            result = (request_id, True, handler.collect(target, scrape_timeout))
+        except Exception as err:
+            try:
+                pickle.dumps(err)
+            except Exception:
+                err = RuntimeError(traceback.format_exc())
+            result = (request_id, False, err)
+
+        with send_lock:
+            connection.send(result)
+
+    try:
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="collect") as executor:
+            while True:
+                # the connection is closed when the front-end process exits
+                request = connection.recv()
+                if request is None:
+                    break
+
+                request_id, method, args = request
+                if method == "metrics":
+                    with send_lock:
+                        connection.send((request_id, True, list(REGISTRY.collect())))
+                else:
+                    executor.submit(collect, request_id, *args)
+
+    except (EOFError, KeyboardInterrupt, SystemExit):
+        pass
+
+    finally:
+        handler.stop()
+        session_pool = get_session_pool(config)
+        if session_pool:
+            session_pool.close()
+
+class CollectionWorker(object):
+
+    def __init__(self, index, config, metrics_type, threads):
+        self.index = index
+        self.pending = {}
+        self.lock = threading.Lock()
+
+        # the worker must not start a pool of its own or the scheduler
+        worker_config = dict(config)
+        worker_config["collection_processes"] = 0
+        worker_config["scheduler"] = {"enabled": False}
+
+        context = worker_context()
+        self.connection, worker_connection = context.Pipe()
+        self.process = context.Process(
+            target = worker_main,
+            args = (worker_config, metrics_type, worker_connection, threads, log_settings()),
+            name = f"collect-{index}",
+            daemon = True
+        )
+        self.process.start()
+        worker_connection.close()
+
+        self._receiver = threading.Thread(target=self._receive, name=f"collect-{index}-results", daemon=True)
+        self._receiver.start()
+
+    def submit(self, request_id, method, *args):
+        future = Future()
+        with self.lock:
+            self.pending[request_id] = future
+            self.connection.send((request_id, method, args))
+        return future
+
+    def _receive(self):
+        while True:
+            try:
+                request_id, ok, payload = self.connection.recv()
+            except (EOFError, OSError):
+                break
+
+            with self.lock:
+                future = self.pending.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(payload)
+
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(RuntimeError(f"Collection worker {self.index} exited"))
+
+    def alive(self):
+        return self.process.is_alive()
+
+    def stop(self, timeout=10):
+        try:
+            with self.lock:
+                self.connection.send(None)
+        except (OSError, ValueError):
+            pass
+
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.connection.close()
+
+class CollectionProcessPool(object):
+    """
+    Collect in worker processes instead of the threads of the server process,
+    so the JSON decoding, SMART parsing and exposition rendering of many
+    targets use all cores.
+
+    A target is always collected by the same worker, which keeps its Redfish
+    session and caches. Every worker collects up to threads targets at once.
+    A worker that exited is started again by the next collection of one of
+    its targets. The metrics of the exporter recorded in the workers are
+    served on /metrics of the front end with the label worker.
+    """
+
+    def __init__(self, config, metrics_type, processes, threads):
+        self.config = config
+        self.metrics_type = metrics_type
+        self.threads = threads
+        self._request_ids = itertools.count()
+        self._lock = threading.Lock()
+
+        self.workers = [CollectionWorker(index, config, metrics_type, threads) for index in range(processes)]
+        logging.info("Collecting %s metrics in %s worker processes", metrics_type, processes)
+
+    def worker_of(self, target):
+        index = shard_of(target, len(self.workers))
+        with self._lock:
+            worker = self.workers[index]
+            if not worker.alive():
+                logging.error("Collection worker %s exited with %s, starting it again", index, worker.process.exitcode)
+                worker.stop(timeout=0)
+                worker = CollectionWorker(index, self.config, self.metrics_type, self.threads)
+                self.workers[index] = worker
+
+        return worker
+
+    def collect(self, target, scrape_timeout=None):
+        """
+        Return the exposition text of the target, collected by its worker.
+        """
+        return self.worker_of(target).submit(next(self._request_ids), "collect", target, scrape_timeout).result()
+
+    def collect_metrics(self, timeout=5):
+        """
+        Return the metric families of the exporter in the running workers,
+        their samples are labelled with the index of the worker.
+        """
+        with self._lock:
+            workers = [worker for worker in self.workers if worker.alive()]
+
+        requests = []
+        for worker in workers:
+            try:
+                requests.append((worker.index, worker.submit(next(self._request_ids), "metrics")))
+            except (OSError, ValueError) as err:
+                logging.warning("Could not request the metrics of collection worker %s: %s", worker.index, err)
+
+        families = []
+        for index, future in requests:
+            try:
+                worker_families = future.result(timeout)
+            except Exception as err:
+                logging.warning("Could not get the metrics of collection worker %s: %r", index, err)
+                continue
+
+            for family in worker_families:
+                family.samples = [sample._replace(labels=dict(sample.labels, worker=str(index))) for sample in family.samples]
+                families.append(family)
+
+        return families
+
+    def close(self):
+        with self._lock:
+            workers, self.workers = self.workers, []
+        for worker in workers:
+            worker.stop()
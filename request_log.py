@@ -0,0 +1,112 @@
+from collections import OrderedDict
+
+import logging
+import os
+import random
+import threading
+import time
+
+class RequestLogger(object):
+    """
+    Log the per-request events of a scrape, e.g. every Redfish request.
+
+    The events are logged at the configured level, so they cost a level check
+    when it is disabled. Only a sample of the events below WARNING is logged
+    and every target may log at most rate messages per second with bursts
+    of burst messages. The number of suppressed messages is added to the
+    next message of the target.
+
+    The target and the event name are passed to the log handlers as the
+    target and event attributes of the record.
+    """
+
+    def __init__(self, level=logging.DEBUG, sample=1.0, rate=0, burst=50, max_targets=4096):
+        self.level = level
+        self.sample = sample
+        self.rate = rate
+        self.burst = burst
+        self.max_targets = max_targets
+
+        self._logger = logging.getLogger()
+        # target -> [tokens, refilled at, suppressed messages]
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _allow(self, target):
+        """
+        Return None if the message is rate limited, otherwise the number of
+        messages of the target that were suppressed before it.
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(target)
+            if bucket is None:
+                bucket = [self.burst, now, 0]
+                self._buckets[target] = bucket
+                while len(self._buckets) > self.max_targets:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(target)
+
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return None
+
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+            return suppressed
+
+    def log(self, target, event, msg, *args, level=None):
+        """
+        Log "Target <target>: <msg % args>" at the level of the events or at
+        the given level, e.g. for errors.
+        """
+        self._log(target, event, msg, args, level or self.level)
+
+    def error(self, target, event, msg, *args):
+        self._log(target, event, msg, args, logging.ERROR)
+
+    def _log(self, target, event, msg, args, level):
+        if not self._logger.isEnabledFor(level):
+            return
+        # warnings and errors are not sampled
+        if self.sample < 1 and level < logging.WARNING and random.random() >= self.sample:
+            return
+
+        suppressed = 0
+        if self.rate > 0:
+            suppressed = self._allow(target)
+            if suppressed is None:
+                return
+
+        if suppressed:
+            msg = f"{msg} (%s messages suppressed)"
+            args = args + (suppressed,)
+
+        # the record shows the file and line of the caller of log or error
+        self._logger.log(level, "Target %s: " + msg, target, *args, extra={"target": target, "event": event}, stacklevel=3)
+
+_request_logger = None
+_request_logger_lock = threading.Lock()
+
+def get_request_logger(config):
+    global _request_logger
+
+    with _request_logger_lock:
+        if _request_logger is None:
+            log_config = config.get("request_logging") or {}
+            level_name = os.getenv("REQUEST_LOG_LEVEL", log_config.get("level", "debug"))
+            level = logging.getLevelName(str(level_name).upper())
+            if not isinstance(level, int):
+                logging.warning("Unknown request log level %s, using debug", level_name)
+                level = logging.DEBUG
+
+            _request_logger = RequestLogger(
+                level = level,
+                sample = float(log_config.get("sample", 1.0)),
+                rate = float(log_config.get("rate", 10)),
+                burst = int(log_config.get("burst", 50))
+            )
+
+    return _request_logger
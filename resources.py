@@ -0,0 +1,118 @@
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import logging
+import threading
+import time
+
+from exporter_metrics import RESOURCE_CACHE_LOOKUPS
+
+# collection name -> (kind of the collection, kind of its members)
+COLLECTION_KINDS = {
+    "StorageServices": ("storage_services", "storage_service"),
+    "StoragePools": ("storage_pools", "storage_pool"),
+    "CapacitySources": ("capacity_sources", "capacity_source"),
+    "ProvidingDrives": ("providing_drives", "drive"),
+    "Drives": ("drives", "drive"),
+    "Sessions": ("sessions", "session"),
+}
+
+# the drives carry the SMART data and the service root tells if the BMC is up,
+# so by default both are fetched on every scrape
+DEFAULT_CACHE_TTLS = {
+    "service_root": 0,
+    "storage_services": 3600,
+    "storage_service": 3600,
+    "storage_pools": 3600,
+    "storage_pool": 3600,
+    "capacity_sources": 3600,
+    "capacity_source": 3600,
+    "providing_drives": 600,
+    "drive": 0,
+    "expanded": 0,
+}
+
+def resource_kind(url):
+    """
+    Classify a Redfish path or URL, e.g. /redfish/v1/StorageServices/S1/StoragePools
+    is "storage_pools" and /redfish/v1/StorageServices/S1 is "storage_service".
+    A resource fetched with the $expand query is "expanded", it carries the
+    drives of its members.
+    """
+    parts = urlsplit(url)
+    if "$expand=" in parts.query:
+        return "expanded"
+
+    path = parts.path.rstrip("/")
+    if path == "/redfish/v1":
+        return "service_root"
+
+    parts = path.split("/")
+    if parts[-1] in COLLECTION_KINDS:
+        return COLLECTION_KINDS[parts[-1]][0]
+    if len(parts) > 1 and parts[-2] in COLLECTION_KINDS:
+        return COLLECTION_KINDS[parts[-2]][1]
+
+    return "other"
+
+CachedResource = namedtuple("CachedResource", ["payload", "etag", "expires"])
+
+class ResourceCache(object):
+    """
+    Redfish resources of one target, cached for a TTL per resource kind.
+
+    A resource with an ETag is kept after its TTL ran out, so it can be
+    revalidated with If-None-Match instead of being fetched again.
+    """
+
+    def __init__(self, ttls):
+        self.ttls = ttls
+        self._resources = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """
+        Return a (resource, fresh) tuple, the resource is None if it is not cached.
+        """
+        with self._lock:
+            cached = self._resources.get(url)
+
+        if cached is not None and cached.expires > time.monotonic():
+            RESOURCE_CACHE_LOOKUPS.labels(resource_kind(url), "hit").inc()
+            return cached, True
+
+        RESOURCE_CACHE_LOOKUPS.labels(resource_kind(url), "miss").inc()
+        return cached, False
+
+    def store(self, url, payload, etag):
+        ttl = self.ttls.get(resource_kind(url), 0)
+        with self._lock:
+            if ttl <= 0 and not etag:
+                self._resources.pop(url, None)
+                return
+            self._resources[url] = CachedResource(payload, etag, time.monotonic() + ttl)
+
+    def revalidated(self, url, cached):
+        RESOURCE_CACHE_LOOKUPS.labels(resource_kind(url), "not_modified").inc()
+        self.store(url, cached.payload, cached.etag)
+
+    def clear(self):
+        with self._lock:
+            self._resources.clear()
+
+    def invalidate(self, url):
+        with self._lock:
+            if self._resources.pop(url, None) is not None:
+                logging.debug("Dropped cached resource %s", url)
+
+def resource_cache_ttls(config):
+    """
+    Return the cache TTL of every resource kind, or None if the cache is disabled.
+    """
+    cache_config = config.get("resource_cache") or {}
+    if not cache_config.get("enabled", False):
+        return None
+
+    ttls = dict(DEFAULT_CACHE_TTLS)
+    ttls.update({kind: int(ttl) for kind, ttl in (cache_config.get("ttl") or {}).items()})
+    return ttls
@@ -0,0 +1,73 @@
+from prometheus_client.core import Metric
+from prometheus_client.samples import Sample
+
+import threading
+
+def escape_label_value(value):
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+class LabelSet(object):
+    """
+    The labels of a sample together with their escaped exposition text, e.g.
+    {disk="/dev/sda",type="sas"}, sorted by name like generate_latest.
+    """
+    __slots__ = ("labels", "rendered")
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.rendered = ""
+        if labels:
+            self.rendered = "{%s}" % ",".join(
+                '%s="%s"' % (name, escape_label_value(value)) for name, value in sorted(labels.items())
+            )
+
+_label_sets = {}
+_label_sets_lock = threading.Lock()
+MAX_LABEL_SETS = 65536
+
+def intern_labels(labels):
+    """
+    Return the LabelSet of the labels, the drives of a target have the same
+    labels on every scrape so their label sets are rendered once.
+    """
+    key = tuple(labels.items())
+    label_set = _label_sets.get(key)
+    if label_set is None:
+        label_set = LabelSet(labels)
+        with _label_sets_lock:
+            if len(_label_sets) >= MAX_LABEL_SETS:
+                _label_sets.clear()
+            _label_sets[key] = label_set
+
+    return label_set
+
+class SampleBuffer(object):
+    """
+    A gauge metric family keeping its samples as (name, LabelSet, value)
+    tuples, rendered by exposition.render_family without building a Sample
+    and formatting the labels for every sample.
+
+    Chunks of the same family are merged by extending the samples like the
+    ones of a GaugeMetricFamily, to_metric returns the family for other
+    prometheus_client consumers.
+    """
+    __slots__ = ("name", "documentation", "samples")
+
+    type = "gauge"
+    unit = ""
+
+    def __init__(self, name, documentation, samples=None):
+        self.name = name
+        self.documentation = documentation
+        self.samples = samples if samples is not None else []
+
+    def add_sample(self, name, label_set, value):
+        self.samples.append((name, label_set, value))
+
+    def copy(self):
+        return SampleBuffer(self.name, self.documentation, list(self.samples))
+
+    def to_metric(self):
+        metric = Metric(self.name, self.documentation, self.type, self.unit)
+        metric.samples = [Sample(name, label_set.labels, value, None, None) for name, label_set, value in self.samples]
+        return metric
@@ -0,0 +1,154 @@
+from concurrent.futures import ThreadPoolExecutor
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.exposition import generate_latest
+
+import heapq
+import logging
+import threading
+import time
+
+class CachedScrape(object):
+
+    def __init__(self, text, collected_at, labels):
+        self.text = text
+        self.collected_at = collected_at
+        self.labels = labels
+
+class CacheAgeCollector(object):
+
+    def __init__(self, labels, age):
+        self.labels = labels
+        self.age = age
+
+    def collect(self):
+        age_metrics = GaugeMetricFamily(
+            "redfish_cache_age_seconds",
+            "Age of the cached Redfish scrape result in seconds",
+            labels = self.labels,
+        )
+        age_metrics.add_metric(self.labels.values(), round(self.age, 2))
+        yield age_metrics
+
+class ScrapeScheduler(object):
+    """
+    Collect the configured targets in the background and cache the rendered
+    exposition text, so a scrape of /health does not wait for the BMC.
+
+    Every target is collected on its own interval. A cached result older than
+    max_age is not served any more and the scrape falls back to a live
+    collection.
+    """
+
+    def __init__(self, config, metrics_type, collect, resolve):
+        self.metrics_type = metrics_type
+        self._collect = collect
+        self._resolve = resolve
+
+        self.interval = int(config.get("interval", 60))
+        self.max_age = int(config.get("max_age", 3 * self.interval))
+        self.workers = int(config.get("workers", 8))
+
+        self.targets = {}
+        for entry in config.get("targets") or []:
+            if isinstance(entry, dict):
+                self.targets[entry["target"]] = int(entry.get("interval", self.interval))
+            else:
+                self.targets[entry] = self.interval
+
+        self._cache = {}
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def start(self):
+        if self._thread or not self.targets:
+            return
+
+        logging.info(
+            "Scheduling %s metrics collection of %s targets every %s seconds",
+            self.metrics_type, len(self.targets), self.interval
+        )
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scheduler")
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._thread:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._executor.shutdown(wait=False)
+        self._thread = None
+
+    def _run(self):
+        # spread the first collections over the interval to avoid a thundering herd
+        now = time.monotonic()
+        step = self.interval / len(self.targets)
+        queue = [(now + i * step, target) for i, target in enumerate(self.targets)]
+        heapq.heapify(queue)
+
+        while not self._stop.is_set():
+            due, target = queue[0]
+            wait = due - time.monotonic()
+            if wait > 0:
+                self._stop.wait(wait)
+                continue
+
+            heapq.heapreplace(queue, (due + self.targets[target], target))
+
+            with self._lock:
+                if target in self._running:
+                    logging.warning("Target %s: Previous scheduled collection still running, skipping", target)
+                    continue
+                self._running.add(target)
+
+            self._executor.submit(self._collect_target, target)
+
+    def _collect_target(self, target):
+        try:
+            logging.debug("Target %s: Scheduled %s metrics collection", target, self.metrics_type)
+            self.store(target, self._collect(target))
+
+        except Exception as err:
+            logging.error("Target %s: Scheduled collection failed: %s", target, err)
+
+        finally:
+            with self._lock:
+                self._running.discard(target)
+
+    def store(self, target, text):
+        if target not in self.targets:
+            return
+
+        with self._lock:
+            cached = self._cache.get(target)
+
+        # the labels of the collector, resolved once per target
+        labels = cached.labels if cached else self.labels(target)
+        with self._lock:
+            self._cache[target] = CachedScrape(text, time.time(), labels)
+
+    def labels(self, target):
+        target_ip, host = self._resolve(target)
+        return {"host": host, "redfish_instance": f"{target_ip}:9220"}
+
+    def get(self, target):
+        """
+        Return the cached exposition text of the target, or None if there is
+        no result or it is older than max_age.
+        """
+        with self._lock:
+            cached = self._cache.get(target)
+
+        if not cached:
+            return None
+
+        age = time.time() - cached.collected_at
+        if age > self.max_age:
+            logging.info("Target %s: Cached result is %.0f seconds old, collecting live", target, age)
+            return None
+
+        return cached.text + generate_latest(CacheAgeCollector(cached.labels, age))
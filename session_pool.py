@@ -0,0 +1,224 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from exporter_metrics import REGISTRY
+
+class PooledSession(object):
+    """
+    A requests session together with the Redfish session token of one target.
+    """
+
+    def __init__(self, target, rf_port, username, max_connections):
+        self.target = target
+        self.rf_port = rf_port
+        self.username = username
+
+        # concurrent scrapes and the storage tree walk share the keep-alive connections
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max_connections))
+        self.session.verify = False
+        self.session.headers.update({"charset": "utf-8"})
+        self.session.headers.update({"content-type": "application/json"})
+        self.session.headers.update({"k": "true"})
+
+        self.auth_token = ""
+        self.session_url = ""
+        self.sessions_url = ""
+
+        self.created = time.time()
+        self.last_used = self.created
+
+        # scrapes using the entry, it is closed when it was evicted and the last one returns it
+        self.users = 0
+        self.evicted = False
+
+        # serialises the (re-)authentication of concurrent scrapes
+        self.lock = threading.RLock()
+
+        # Redfish resources that are reused by the following scrapes
+        self.resource_cache = None
+
+        # used instead of the requests session by the async engine
+        self.async_session = None
+        self.async_loop = None
+        self.async_lock = None
+
+    def invalidate_token(self):
+        self.auth_token = ""
+        self.session_url = ""
+
+    def delete_session(self, auth_token, session_url, timeout):
+        logging.debug("Target %s: Deleting Redfish session %s", self.target, session_url)
+        try:
+            self.session.delete(
+                f"https://{self.target}:{self.rf_port}{session_url}",
+                headers={"X-Auth-Token": auth_token},
+                timeout=timeout
+            )
+        except requests.exceptions.RequestException as err:
+            logging.debug("Target %s: Could not delete Redfish session: %s", self.target, err)
+
+    def close(self, timeout):
+        if self.auth_token and self.session_url:
+            self.delete_session(self.auth_token, self.session_url, timeout)
+
+        self.invalidate_token()
+        self.session.close()
+
+        if self.async_session:
+            asyncio.run_coroutine_threadsafe(self.async_session.close(), self.async_loop)
+            self.async_session = None
+
+class SessionPool(object):
+    """
+    Process wide, thread safe pool of Redfish sessions keyed by target.
+
+    Entries are reference counted by the scrapes using them. An entry older
+    than ttl is replaced, a token that was not used for idle_timeout seconds
+    is logged out and the next scrape authenticates again. When the pool is
+    full, the least recently used idle entry is evicted; if every entry is in
+    use or was used within idle_timeout, the scrape logs in without the pool
+    instead of closing the session of another target.
+
+    Evicted entries are closed by a background thread when their last scrape
+    returned them, so a slow BMC does not delay the scrape of another target.
+    """
+
+    def __init__(self, max_size, ttl, idle_timeout, timeout, max_connections):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.overflows = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._closer = ThreadPoolExecutor(max_workers=4, thread_name_prefix="session-close")
+
+    def acquire(self, target, rf_port, username):
+        """
+        Return the pooled session of the target, or None if the pool is full.
+        Every acquired entry has to be returned with release.
+        """
+        key = (target, rf_port, username)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry.created > self.ttl:
+                logging.debug("Target %s: Pooled session expired after %s seconds", target, self.ttl)
+                self._evict(self._entries.pop(key))
+                entry = None
+
+            if not entry:
+                if len(self._entries) >= self.max_size and not self._evict_idle(now):
+                    self.overflows += 1
+                    logging.debug("Target %s: Session pool is full, logging in without it", target)
+                    return None
+
+                entry = PooledSession(target, rf_port, username, self.max_connections)
+                self._entries[key] = entry
+                logging.debug("Target %s: Added session to the pool", target)
+
+            elif not entry.users and entry.auth_token and now - entry.last_used > self.idle_timeout:
+                logging.debug("Target %s: Pooled session idle for more than %s seconds", target, self.idle_timeout)
+                self._closer.submit(entry.delete_session, entry.auth_token, entry.session_url, self.timeout)
+                entry.invalidate_token()
+
+            entry.users += 1
+            entry.last_used = now
+            self._entries.move_to_end(key)
+
+        return entry
+
+    def release(self, entry):
+        with self._lock:
+            entry.users -= 1
+            entry.last_used = time.time()
+            if entry.evicted and not entry.users:
+                self._closer.submit(entry.close, self.timeout)
+
+    def _evict(self, entry):
+        # called with the pool lock held
+        entry.evicted = True
+        if not entry.users:
+            self._closer.submit(entry.close, self.timeout)
+
+    def _evict_idle(self, now):
+        # called with the pool lock held, the entries are ordered from least to most recently used
+        for key, entry in self._entries.items():
+            if not entry.users and now - entry.last_used > self.idle_timeout:
+                logging.debug("Target %s: Evicting least recently used session", entry.target)
+                self._evict(self._entries.pop(key))
+                return True
+
+        return False
+
+    def collect(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            overflows = self.overflows
+
+        session_metrics = GaugeMetricFamily(
+            "redfish_exporter_pooled_sessions",
+            "Pooled sessions by state, authenticated ones hold a Redfish session token",
+            labels = ["state"],
+        )
+        authenticated = len([entry for entry in entries if entry.auth_token])
+        session_metrics.add_metric(["authenticated"], authenticated)
+        session_metrics.add_metric(["unauthenticated"], len(entries) - authenticated)
+        yield session_metrics
+
+        overflow_metrics = CounterMetricFamily(
+            "redfish_exporter_session_pool_overflows",
+            "Scrapes that logged in without the session pool because it was full",
+        )
+        overflow_metrics.add_metric([], overflows)
+        yield overflow_metrics
+
+    def close(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+
+        self._closer.shutdown(wait=True)
+        for entry in entries:
+            entry.close(self.timeout)
+
+_session_pool = None
+_session_pool_lock = threading.Lock()
+
+def get_session_pool(config):
+    """
+    Return the process wide session pool, or None if pooling is disabled.
+    """
+    global _session_pool
+
+    max_size = int(os.getenv("SESSION_POOL_SIZE", config.get('session_pool_size', 128)))
+    if max_size <= 0:
+        return None
+
+    with _session_pool_lock:
+        if _session_pool is None:
+            _session_pool = SessionPool(
+                max_size = max_size,
+                ttl = int(os.getenv("SESSION_TTL", config.get('session_ttl', 3600))),
+                idle_timeout = int(os.getenv("SESSION_IDLE_TIMEOUT", config.get('session_idle_timeout', 300))),
+                timeout = int(os.getenv("TIMEOUT", config.get('timeout', 10))),
+                max_connections = int(os.getenv("SESSION_MAX_CONNECTIONS", config.get('session_max_connections', 16)))
+            )
+            REGISTRY.register(_session_pool)
+            logging.info("Using a Redfish session pool of size %s", max_size)
+
+    return _session_pool
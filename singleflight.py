@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+
+from exporter_metrics import COALESCED_COLLECTIONS
+
+class Flight(object):
+
+    def __init__(self):
+        self.result = None
+        self.error = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def done(self):
+        return self._done.is_set()
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.finished_at = time.monotonic()
+        self._done.set()
+
+    def wait(self, timeout):
+        if not self._done.wait(timeout):
+            raise TimeoutError("collection still running after %s seconds" % timeout)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class SingleFlight(object):
+    """
+    Coalesce concurrent collections with the same key, e.g. two Prometheus
+    replicas scraping the same target. The first caller collects and the
+    others wait for its result, which is also reused for grace seconds
+    after the collection finished.
+
+    A caller that waited for wait_timeout seconds collects on its own, one
+    whose deadline passed while it waited gives up.
+    """
+
+    def __init__(self, grace=0, wait_timeout=300):
+        self.grace = grace
+        self.wait_timeout = wait_timeout
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._pruned_at = time.monotonic()
+
+    def _reusable(self, flight, now):
+        if not flight.done():
+            return True
+        return flight.error is None and now - flight.finished_at <= self.grace
+
+    def _prune(self, now):
+        # finished flights are kept for the grace window only
+        if now - self._pruned_at < max(self.grace, 1):
+            return
+        self._pruned_at = now
+        for key in [key for key, flight in self._flights.items() if not self._reusable(flight, now)]:
+            del self._flights[key]
+
+    def join(self, key):
+        """
+        Return the flight of the key and whether the caller is its leader and
+        has to collect and complete it.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            flight = self._flights.get(key)
+            if flight and self._reusable(flight, now):
+                COALESCED_COLLECTIONS.labels(key[1]).inc()
+                return flight, False
+
+            flight = Flight()
+            self._flights[key] = flight
+            return flight, True
+
+    def complete(self, key, flight, result=None, error=None):
+        flight.finish(result, error)
+        if error is not None or self.grace <= 0:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    def wait(self, key, flight, collect, deadline=None):
+        """
+        Return the result of the flight, waiting at most until the
+        time.monotonic() deadline of the caller.
+        """
+        timeout = self.wait_timeout
+        if deadline is not None:
+            timeout = min(timeout, max(0, deadline - time.monotonic()))
+
+        try:
+            logging.debug("Target %s: Waiting for the running %s collection", key[0], key[1])
+            return flight.wait(timeout)
+
+        except TimeoutError as err:
+            if deadline is not None and time.monotonic() >= deadline:
+                # a collection of its own would not finish before the deadline either
+                raise TimeoutError(f"Target {key[0]}: {err}, the scrape deadline passed") from None
+
+            logging.warning("Target %s: %s, collecting again", key[0], err)
+            return collect()
+
+    def do(self, key, collect, deadline=None):
+        """
+        Return the result of collect(), shared by the concurrent callers of the key.
+        """
+        flight, leader = self.join(key)
+        if not leader:
+            return self.wait(key, flight, collect, deadline)
+
+        try:
+            result = collect()
+        except BaseException as err:
+            self.complete(key, flight, error=err)
+            raise
+
+        self.complete(key, flight, result=result)
+        return result
@@ -0,0 +1,95 @@
+import asyncio
+import concurrent.futures
+import json
+import time
+
+import pytest
+
+from async_engine import DEADLINE_GRACE, AsyncRedfishMetricsCollector, get_async_engine
+from session_pool import SessionPool
+
+SERVICE_ROOT = {
+    "@odata.id": "/redfish/v1",
+    "SessionService": {"@odata.id": "/redfish/v1/SessionService"},
+    "StorageServices": {"@odata.id": "/redfish/v1/StorageServices"},
+}
+
+CONFIG = {
+    "resource_cache": {"enabled": False},
+    "circuit_breaker": {"enabled": False},
+    "topology": {"enabled": False},
+}
+
+class RejectingBMC(object):
+    """
+    BMC rejecting the pooled tokens: the token of the pool answers with an
+    error while another scrape logs in with token-1, which the BMC rejects
+    as well. Only the token of a new login is accepted.
+    """
+
+    def __init__(self, pooled):
+        self.pooled = pooled
+        self.logins = 0
+
+    async def request(self, method, url, auth=None, headers=None, **kwargs):
+        token = (headers or {}).get("X-Auth-Token")
+        if method == "POST":
+            self.logins += 1
+            session = {"@odata.id": f"/redfish/v1/SessionService/Sessions/{self.logins}"}
+            return 201, {"X-Auth-Token": "new-token"}, json.dumps(session).encode()
+
+        if token == "token-0":
+            # another scrape of the target logged in meanwhile
+            self.pooled.auth_token = "token-1"
+            return 500, {}, b""
+        if token == "token-1":
+            return 401, {}, b""
+
+        return 200, {}, json.dumps(SERVICE_ROOT).encode()
+
+@pytest.fixture
+def pool():
+    pool = SessionPool(max_size=4, ttl=3600, idle_timeout=300, timeout=1, max_connections=1)
+    yield pool
+    pool._closer.shutdown(wait=True)
+
+def test_token_rejected_under_the_login_lock_logs_in(pool):
+    pooled = pool.acquire("node-1", 443, "root")
+    pooled.auth_token = "token-0"
+    pooled.session_url = "/redfish/v1/SessionService/Sessions/0"
+    pooled.sessions_url = "https://node-1:443/redfish/v1/SessionService/Sessions"
+    pool.release(pooled)
+    bmc = RejectingBMC(pooled)
+
+    collector = AsyncRedfishMetricsCollector(
+        CONFIG, "node-1", "node-1", 443, "root", "secret", "health",
+        session_pool = pool,
+        deadline = time.monotonic() + 2
+    )
+    with collector:
+        collector._async_request = bmc.request
+        collector.get_session()
+
+        assert collector._redfish_up == 1
+        assert not collector.scrape_partial
+        assert pooled.auth_token == "new-token"
+        assert not pooled.async_lock.locked()
+
+def test_run_cancels_the_coroutine_after_the_deadline():
+    engine = get_async_engine()
+    cancelled = []
+
+    async def hang():
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    start = time.monotonic()
+    with pytest.raises(concurrent.futures.TimeoutError):
+        engine.run(hang(), deadline=start)
+
+    assert time.monotonic() - start < DEADLINE_GRACE + 1
+    engine.run(asyncio.sleep(0.01))
+    assert cancelled == [True]
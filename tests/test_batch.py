@@ -0,0 +1,56 @@
+import io
+
+from batch import ExpositionMerger
+
+def exposition(host, temperature):
+    return (
+        b"# HELP redfish_up Redfish Server Monitoring availability\n"
+        b"# TYPE redfish_up gauge\n"
+        b'redfish_up{host="%s"} 1.0\n'
+        b"# HELP smartmon_temperature_celsius_raw_value SMART metric temperature_celsius_raw_value\n"
+        b"# TYPE smartmon_temperature_celsius_raw_value gauge\n"
+        b'smartmon_temperature_celsius_raw_value{host="%s"} %s\n'
+    ) % (host, host, temperature)
+
+def merged(merger):
+    stream = io.BytesIO()
+    merger.write(stream)
+    return stream.getvalue()
+
+def test_families_of_all_targets_are_merged():
+    merger = ExpositionMerger()
+    merger.add(exposition(b"node-1", b"31.0"))
+    merger.add(exposition(b"node-2", b"35.0"))
+
+    assert merged(merger) == (
+        b"# HELP redfish_up Redfish Server Monitoring availability\n"
+        b"# TYPE redfish_up gauge\n"
+        b'redfish_up{host="node-1"} 1.0\n'
+        b'redfish_up{host="node-2"} 1.0\n'
+        b"# HELP smartmon_temperature_celsius_raw_value SMART metric temperature_celsius_raw_value\n"
+        b"# TYPE smartmon_temperature_celsius_raw_value gauge\n"
+        b'smartmon_temperature_celsius_raw_value{host="node-1"} 31.0\n'
+        b'smartmon_temperature_celsius_raw_value{host="node-2"} 35.0\n'
+    )
+
+def test_family_of_a_later_target_is_appended():
+    merger = ExpositionMerger()
+    merger.add(b'# HELP redfish_up up\n# TYPE redfish_up gauge\nredfish_up{host="node-1"} 0.0\n')
+    merger.add(exposition(b"node-2", b"35.0"))
+
+    text = merged(merger)
+    assert text.count(b"# TYPE ") == 2
+    assert text.endswith(b'smartmon_temperature_celsius_raw_value{host="node-2"} 35.0\n')
+
+def test_samples_beyond_the_spool_size_are_moved_to_a_file():
+    with ExpositionMerger(spool_size=64) as merger:
+        for index in range(10):
+            merger.add(exposition(b"node-%d" % index, b"31.0"))
+
+        assert all(samples._rolled for _, samples in merger.families.values())
+        text = merged(merger)
+
+    assert text.count(b"# TYPE ") == 2
+    assert text.count(b"redfish_up{") == 10
+    assert text.index(b'redfish_up{host="node-9"}') < text.index(b"# HELP smartmon_")
+    assert not merger.families
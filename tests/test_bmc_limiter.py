@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+
+from bmc_limiter import BMCLimiter, BMCLimiters
+
+def make_limiter(initial_limit=4, min_limit=1, max_limit=16, rate=0, burst=10, backoff_interval=1):
+    return BMCLimiter("node-1", "default", rate, burst, initial_limit, min_limit, max_limit, backoff_interval)
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+def test_success_raises_the_limit_additively():
+    limiter = make_limiter(initial_limit=4)
+
+    assert limiter.acquire()
+    limiter.release("200")
+
+    assert limiter.limit == 4.25
+    assert limiter.in_flight == 0
+
+def test_overload_halves_the_limit_once_per_interval():
+    limiter = make_limiter(initial_limit=8)
+
+    for code in ("503", "408"):
+        assert limiter.acquire()
+        limiter.release(code)
+
+    assert limiter.limit == 4
+
+def test_limit_stays_within_its_bounds():
+    limiter = make_limiter(initial_limit=2, min_limit=1, max_limit=3, backoff_interval=0)
+
+    for _ in range(10):
+        assert limiter.acquire()
+        limiter.release("429")
+    assert limiter.limit == 1
+
+    for _ in range(20):
+        assert limiter.acquire()
+        limiter.release("200")
+    assert limiter.limit == 3
+
+def test_waiters_are_served_first_in_first_out():
+    limiter = make_limiter(initial_limit=1, max_limit=1)
+    assert limiter.acquire()
+
+    served = []
+    threads = []
+    for index in range(3):
+        thread = threading.Thread(target=lambda index=index: limiter.acquire(timeout=5) and served.append(index))
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: len(limiter._waiters) == index + 1)
+
+    for index in range(3):
+        # every release hands the slot to the next waiter
+        limiter.release("200")
+        wait_until(lambda: len(served) == index + 1)
+
+    for thread in threads:
+        thread.join()
+    assert served == [0, 1, 2]
+
+def test_timed_out_waiter_leaves_the_queue():
+    limiter = make_limiter(initial_limit=1, max_limit=1)
+    assert limiter.acquire()
+
+    assert not limiter.acquire(timeout=0.05)
+    assert not limiter._waiters
+    assert limiter.in_flight == 1
+
+    limiter.release("200")
+    assert limiter.in_flight == 0
+
+def test_rate_delay_longer_than_the_timeout_gives_up():
+    limiter = make_limiter(rate=1, burst=1)
+    assert limiter.acquire()
+    limiter.release("200")
+
+    start = time.monotonic()
+    assert not limiter.acquire(timeout=0.1)
+    assert time.monotonic() - start < 0.5
+
+def test_async_waiter_gets_the_released_slot():
+    limiter = make_limiter(initial_limit=1, max_limit=1)
+    assert limiter.acquire()
+
+    async def scrape():
+        waiting = asyncio.ensure_future(limiter.async_acquire(timeout=5))
+        await asyncio.sleep(0.01)
+        limiter.release("200")
+        return await waiting
+
+    assert asyncio.run(scrape())
+    assert limiter.in_flight == 1
+
+def test_async_waiter_times_out():
+    limiter = make_limiter(initial_limit=1, max_limit=1)
+    assert limiter.acquire()
+
+    assert not asyncio.run(limiter.async_acquire(timeout=0.05))
+    assert not limiter._waiters
+    assert limiter.in_flight == 1
+
+def test_metrics_are_summed_by_target_class():
+    limiters = BMCLimiters({"initial_concurrency": 4})
+    limiters.get("node-1", "compute").acquire()
+    limiters.get("node-2", "compute")
+    limiters.get("node-3", "storage")
+
+    limit_metrics, in_flight_metrics = limiters.collect()
+    assert [(sample.labels, sample.value) for sample in limit_metrics.samples] == [
+        ({"target_class": "compute"}, 8),
+        ({"target_class": "storage"}, 4),
+    ]
+    assert [(sample.labels, sample.value) for sample in in_flight_metrics.samples] == [
+        ({"target_class": "compute"}, 1),
+        ({"target_class": "storage"}, 0),
+    ]
+
+def test_per_target_metrics():
+    limiters = BMCLimiters({"per_target_metrics": True})
+    limiters.get("node-1", "compute")
+
+    limit_metrics, _ = limiters.collect()
+    assert limit_metrics.samples[0].labels == {"target_class": "compute", "target": "node-1"}
+
+def test_request_giving_up_returns_its_rate_token():
+    limiter = make_limiter(rate=1, burst=1)
+    assert limiter.acquire()
+    limiter.release("200")
+
+    for _ in range(3):
+        assert not limiter.acquire(timeout=0.1)
+    assert limiter._tokens > -1
+
+def test_timed_out_waiter_returns_its_rate_token():
+    limiter = make_limiter(initial_limit=1, max_limit=1, rate=0.001, burst=10)
+    assert limiter.acquire()
+
+    assert not limiter.acquire(timeout=0.05)
+    assert not asyncio.run(limiter.async_acquire(timeout=0.05))
+    assert limiter._tokens > 8.5
@@ -0,0 +1,87 @@
+import pytest
+
+import circuit_breaker
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakers
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker, "time", clock)
+    return clock
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("node-1", failure_threshold=2, backoff=10, max_backoff=25)
+
+def test_circuit_opens_after_the_failure_threshold(breaker):
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == CLOSED
+
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+def test_success_resets_the_failures(breaker):
+    breaker.record(False)
+    breaker.record(True)
+    breaker.record(False)
+
+    assert breaker.state == CLOSED
+
+def test_single_probe_after_the_backoff(breaker, clock):
+    breaker.record(False)
+    breaker.record(False)
+
+    clock.now += 9
+    assert not breaker.allow()
+
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+def test_failed_probe_doubles_the_backoff_up_to_the_maximum(breaker, clock):
+    breaker.record(False)
+    breaker.record(False)
+
+    for backoff in (20, 25, 25):
+        clock.now += breaker.backoff
+        assert breaker.allow()
+        breaker.record(False)
+        assert breaker.state == OPEN
+        assert breaker.backoff == backoff
+
+def test_successful_probe_closes_the_circuit(breaker, clock):
+    breaker.record(False)
+    breaker.record(False)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record(False)
+
+    clock.now += 20
+    assert breaker.allow()
+    breaker.record(True)
+
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
+    assert breaker.backoff == 10
+    assert breaker.allow()
+
+def test_only_circuits_that_are_not_closed_are_reported(clock):
+    breakers = CircuitBreakers({"failure_threshold": 1})
+    breakers.get("node-1").record(False)
+    breakers.get("node-2").record(True)
+
+    state_metrics, = breakers.collect()
+    assert [(sample.labels, sample.value) for sample in state_metrics.samples] == [({"target": "node-1"}, OPEN)]
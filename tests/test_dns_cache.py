@@ -0,0 +1,32 @@
+import socket
+
+import pytest
+
+from dns_cache import DNSCache
+
+def failing_lookup(calls):
+    def resolve(host):
+        calls.append(host)
+        raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+    return resolve
+
+def test_failed_lookup_is_cached_and_raised_as_a_new_error():
+    cache = DNSCache(ttl=300, negative_ttl=30, max_size=16)
+    calls = []
+
+    errors = []
+    for _ in range(3):
+        with pytest.raises(socket.gaierror) as err:
+            cache._lookup("forward", "node-1", failing_lookup(calls), socket.gaierror)
+        errors.append(err.value)
+
+    assert calls == ["node-1"]
+    assert errors[1] is not errors[2]
+    assert errors[2].args == (socket.EAI_NONAME, "Name or service not known")
+    assert errors[2].__traceback__.tb_next.tb_next is None
+
+def test_expired_result_is_used_when_the_lookup_fails():
+    cache = DNSCache(ttl=300, negative_ttl=30, max_size=16)
+    cache._store("forward", "node-1", "10.0.0.1", None, -1)
+
+    assert cache._lookup("forward", "node-1", failing_lookup([]), socket.gaierror) == "10.0.0.1"
@@ -0,0 +1,112 @@
+import gzip
+import json
+
+import pytest
+
+from prometheus_client.exposition import generate_latest
+
+import bmc_capture
+
+from async_engine import AsyncRedfishMetricsCollector
+from bmc_capture import CAPTURE_VERSION
+from collector import RedfishMetricsCollector
+
+ROOT = "/redfish/v1"
+SOURCE = f"{ROOT}/StorageServices/S0/StoragePools/P0/CapacitySources/C0"
+
+def collection(url, members):
+    return {"@odata.id": url, "Members@odata.count": len(members), "Members": [{"@odata.id": member} for member in members]}
+
+def build_tree():
+    """
+    Return the Redfish resources of a BMC with one NVMe and one SAS drive by path.
+    """
+    drives = [f"{ROOT}/Chassis/1/Drives/D0", f"{ROOT}/Chassis/1/Drives/D1"]
+    return {
+        ROOT: {
+            "@odata.id": ROOT,
+            "SessionService": {"@odata.id": f"{ROOT}/SessionService"},
+            "StorageServices": {"@odata.id": f"{ROOT}/StorageServices"},
+        },
+        f"{ROOT}/SessionService": {"@odata.id": f"{ROOT}/SessionService", "Sessions": {"@odata.id": f"{ROOT}/SessionService/Sessions"}},
+        f"{ROOT}/StorageServices": collection(f"{ROOT}/StorageServices", [f"{ROOT}/StorageServices/S0"]),
+        f"{ROOT}/StorageServices/S0": {"@odata.id": f"{ROOT}/StorageServices/S0", "StoragePools": {"@odata.id": f"{ROOT}/StorageServices/S0/StoragePools"}},
+        f"{ROOT}/StorageServices/S0/StoragePools": collection(f"{ROOT}/StorageServices/S0/StoragePools", [f"{ROOT}/StorageServices/S0/StoragePools/P0"]),
+        f"{ROOT}/StorageServices/S0/StoragePools/P0": {"@odata.id": f"{ROOT}/StorageServices/S0/StoragePools/P0", "CapacitySources": {"@odata.id": f"{ROOT}/StorageServices/S0/StoragePools/P0/CapacitySources"}},
+        f"{ROOT}/StorageServices/S0/StoragePools/P0/CapacitySources": collection(f"{ROOT}/StorageServices/S0/StoragePools/P0/CapacitySources", [SOURCE]),
+        SOURCE: {"@odata.id": SOURCE, "ProvidingDrives": {"@odata.id": f"{SOURCE}/ProvidingDrives"}},
+        f"{SOURCE}/ProvidingDrives": collection(f"{SOURCE}/ProvidingDrives", drives),
+        drives[0]: {
+            "@odata.id": drives[0],
+            "Id": "SN0",
+            "Model": "Replay Drive",
+            "MediaType": "NVMe",
+            "Status": {"State": "Enabled", "Health": "OK"},
+            "Oem": {"SmartData": {"SMART/Health Information [nvme0n1]": "", "Temperature": "31 Celsius", "Percentage Used": "3%"}},
+        },
+        drives[1]: {
+            "@odata.id": drives[1],
+            "Id": "SN1",
+            "Model": "Replay Drive",
+            "MediaType": "SAS",
+            "Status": {"State": "Enabled", "Health": "OK"},
+            "Oem": {"SmartData": {"Device [sd1]": "", "Current Drive Temperature": "35 C", "Accumulated power on hours": "20001"}},
+        },
+    }
+
+def write_capture(directory, tree):
+    exchanges = [
+        {"method": "GET", "path": path, "status": 200, "headers": {"Content-Type": "application/json"},
+         "body": json.dumps(resource), "offset": 0, "duration": 0}
+        for path, resource in tree.items()
+    ]
+    capture = {"version": CAPTURE_VERSION, "target": "node-1", "metrics_type": "health", "started": 0, "exchanges": exchanges}
+    with gzip.open(directory / "node-1-health.json.gz", "wt", encoding="utf8") as capture_file:
+        json.dump(capture, capture_file)
+
+def replay_config(directory, **config):
+    config.update({
+        "capture": {"mode": "replay", "directory": str(directory), "latency_scale": 0},
+        "topology": {"enabled": False},
+        "resource_cache": {"enabled": False},
+        "expand_query": {"enabled": False},
+        "circuit_breaker": {"enabled": False},
+    })
+    return config
+
+@pytest.fixture
+def replay(monkeypatch):
+    # every test replays its own captures
+    monkeypatch.setattr(bmc_capture, "_replayer", None)
+
+def scrape(collector_class, config, target):
+    with collector_class(config, target=target, host=target, rf_port=443, usr="root", pwd="secret", metrics_type="health") as collector:
+        collector.get_session()
+        return collector, generate_latest(collector).decode()
+
+@pytest.mark.parametrize("collector_class", [RedfishMetricsCollector, AsyncRedfishMetricsCollector])
+def test_scrape_of_the_replayed_bmc(replay, tmp_path, collector_class):
+    write_capture(tmp_path, build_tree())
+
+    collector, text = scrape(collector_class, replay_config(tmp_path), f"replay-{collector_class.__name__}")
+
+    assert collector._redfish_up == 1
+    assert collector.storage_complete
+    assert 'smartmon_temperature_celsius_raw_value{disk="/dev/nvme0n1"' in text
+    assert 'smartmon_percentage_used_raw_value{disk="/dev/nvme0n1"' in text
+    assert 'smartmon_power_on_hours_raw_value{disk="/dev/sd1"' in text
+
+@pytest.mark.parametrize("collector_class", [RedfishMetricsCollector, AsyncRedfishMetricsCollector])
+def test_incomplete_walk_is_not_cached(replay, tmp_path, collector_class):
+    tree = build_tree()
+    # the unrecorded drive is answered with a 404
+    del tree[f"{ROOT}/Chassis/1/Drives/D1"]
+    write_capture(tmp_path, tree)
+    config = replay_config(tmp_path, metric_groups={"intervals": {"smart": 60}})
+
+    target = f"replay-partial-{collector_class.__name__}"
+    collector, text = scrape(collector_class, config, target)
+
+    assert 'disk="/dev/nvme0n1"' in text
+    assert not collector.storage_complete
+    assert collector._smart_cache.get(target) is None
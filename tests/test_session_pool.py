@@ -0,0 +1,106 @@
+import pytest
+
+from session_pool import PooledSession, SessionPool
+
+IDLE_TIMEOUT = 300
+TTL = 3600
+
+@pytest.fixture
+def closed(monkeypatch):
+    targets = []
+    monkeypatch.setattr(PooledSession, "close", lambda self, timeout: targets.append(self.target))
+    return targets
+
+@pytest.fixture
+def deleted(monkeypatch):
+    sessions = []
+    monkeypatch.setattr(
+        PooledSession, "delete_session",
+        lambda self, auth_token, session_url, timeout: sessions.append((self.target, auth_token, session_url))
+    )
+    return sessions
+
+@pytest.fixture
+def pool(closed, deleted):
+    pool = SessionPool(max_size=2, ttl=TTL, idle_timeout=IDLE_TIMEOUT, timeout=1, max_connections=1)
+    yield pool
+    pool._closer.shutdown(wait=True)
+
+def finish_closing(pool):
+    # the entries are closed by the background threads of the pool
+    pool._closer.shutdown(wait=True)
+
+def make_idle(entry):
+    entry.last_used -= IDLE_TIMEOUT + 1
+
+def test_concurrent_scrapes_share_the_entry(pool):
+    first = pool.acquire("node-1", 443, "root")
+    second = pool.acquire("node-1", 443, "root")
+
+    assert first is second
+    assert first.users == 2
+
+    pool.release(first)
+    pool.release(second)
+    assert first.users == 0
+
+def test_expired_entry_is_closed_by_its_last_user(pool, closed):
+    old = pool.acquire("node-1", 443, "root")
+    old.created -= TTL + 1
+
+    renewed = pool.acquire("node-1", 443, "root")
+    assert renewed is not old
+    assert old.evicted
+    assert closed == []
+
+    pool.release(old)
+    finish_closing(pool)
+    assert closed == ["node-1"]
+
+def test_full_pool_evicts_the_least_recently_used_idle_entry(pool, closed):
+    for target in ("node-1", "node-2"):
+        entry = pool.acquire(target, 443, "root")
+        pool.release(entry)
+        make_idle(entry)
+
+    assert pool.acquire("node-3", 443, "root") is not None
+
+    finish_closing(pool)
+    assert closed == ["node-1"]
+    assert [key[0] for key in pool._entries] == ["node-2", "node-3"]
+
+def test_full_pool_does_not_evict_busy_or_recently_used_entries(pool, closed):
+    busy = pool.acquire("node-1", 443, "root")
+    recent = pool.acquire("node-2", 443, "root")
+    pool.release(recent)
+
+    assert pool.acquire("node-3", 443, "root") is None
+    assert pool.overflows == 1
+
+    finish_closing(pool)
+    assert closed == []
+    assert busy.users == 1
+
+def test_idle_session_is_deleted_before_logging_in_again(pool, deleted):
+    entry = pool.acquire("node-1", 443, "root")
+    entry.auth_token = "token"
+    entry.session_url = "/redfish/v1/SessionService/Sessions/1"
+    pool.release(entry)
+    make_idle(entry)
+
+    assert pool.acquire("node-1", 443, "root") is entry
+    assert entry.auth_token == ""
+
+    finish_closing(pool)
+    assert deleted == [("node-1", "token", "/redfish/v1/SessionService/Sessions/1")]
+
+def test_session_in_use_is_not_logged_out(pool, deleted):
+    entry = pool.acquire("node-1", 443, "root")
+    entry.auth_token = "token"
+    make_idle(entry)
+
+    assert pool.acquire("node-1", 443, "root") is entry
+    assert entry.auth_token == "token"
+
+    finish_closing(pool)
+    assert deleted == []
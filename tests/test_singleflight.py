@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+KEY = ("node-1", "health")
+
+def test_followers_get_the_result_of_the_leader():
+    singleflight = SingleFlight()
+    flight, leader = singleflight.join(KEY)
+    assert leader
+
+    followers = [singleflight.join(KEY) for _ in range(3)]
+    assert all(follower is flight and not leads for follower, leads in followers)
+
+    singleflight.complete(KEY, flight, result="metrics")
+    assert [singleflight.wait(KEY, follower, lambda: "own") for follower, _ in followers] == ["metrics"] * 3
+
+def test_concurrent_calls_collect_once():
+    singleflight = SingleFlight()
+    started = threading.Event()
+    finish = threading.Event()
+    calls = []
+
+    def collect():
+        calls.append(1)
+        started.set()
+        finish.wait(5)
+        return "metrics"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(singleflight.do(KEY, collect)))
+    leader.start()
+    started.wait(5)
+
+    flight, leads = singleflight.join(KEY)
+    assert not leads
+
+    finish.set()
+    leader.join()
+    assert singleflight.wait(KEY, flight, collect) == "metrics"
+    assert results == ["metrics"]
+    assert len(calls) == 1
+
+def test_error_is_raised_to_the_followers_and_not_reused():
+    singleflight = SingleFlight(grace=60)
+    flight, _ = singleflight.join(KEY)
+    follower, _ = singleflight.join(KEY)
+
+    singleflight.complete(KEY, flight, error=ValueError("unreachable"))
+    with pytest.raises(ValueError):
+        singleflight.wait(KEY, follower, lambda: "own")
+
+    assert singleflight.join(KEY)[1]
+
+def test_result_is_reused_within_the_grace_window():
+    singleflight = SingleFlight(grace=60)
+    singleflight.do(KEY, lambda: "first")
+    assert singleflight.do(KEY, lambda: "second") == "first"
+
+    singleflight = SingleFlight(grace=0)
+    singleflight.do(KEY, lambda: "first")
+    assert singleflight.do(KEY, lambda: "second") == "second"
+
+def test_follower_collects_on_its_own_after_the_wait_timeout():
+    singleflight = SingleFlight(wait_timeout=0.01)
+    singleflight.join(KEY)
+    flight, _ = singleflight.join(KEY)
+
+    assert singleflight.wait(KEY, flight, lambda: "own") == "own"
+
+def test_follower_waits_until_its_deadline_only():
+    singleflight = SingleFlight(wait_timeout=300)
+    singleflight.join(KEY)
+    flight, _ = singleflight.join(KEY)
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        singleflight.wait(KEY, flight, lambda: "own", deadline=start + 0.05)
+    assert time.monotonic() - start < 1
+
+def test_wait_timeout_before_the_deadline_collects_on_its_own():
+    singleflight = SingleFlight(wait_timeout=0.01)
+    singleflight.join(KEY)
+    flight, _ = singleflight.join(KEY)
+
+    assert singleflight.wait(KEY, flight, lambda: "own", deadline=time.monotonic() + 60) == "own"
@@ -0,0 +1,59 @@
+import logging
+
+import pytest
+
+from collectors.smart_attributes import SMART_TABLES, SmartTable, build_smart_tables
+
+@pytest.mark.parametrize("key, attribute", [
+    ("Available spare", "available_spare"),
+    ("Available spare threshold", "available_spare_threshold"),
+    ("Host write commands", "host_write"),
+    ("Host read commands", "host_read"),
+    ("Power cycles", "power_cycles_count"),
+    ("Percentage used", "percentage_used"),
+    ("Critical Warning", None),
+])
+def test_nvme_keys_match_the_first_matching_pattern(key, attribute):
+    assert SMART_TABLES["nvme"].attribute_of(key) == attribute
+
+def test_earlier_pattern_wins():
+    table = SmartTable("sata", [["drive_temperature", "[Tt]emp"], ["temperature", "[Tt]emperature"]], [])
+
+    assert table.attribute_of("Temperature") == "drive_temperature"
+    # served from the matched keys
+    assert table.attribute_of("Temperature") == "drive_temperature"
+
+def test_later_key_overwrites_the_value_of_the_attribute():
+    table = SMART_TABLES["sas"]
+
+    assert table.attributes({"Drive Temperature": "30 C", "Current Drive Temperature": "31 C"}) == {"temperature": "31 c"}
+
+def test_samples_are_parsed_in_the_order_of_the_metrics():
+    samples = SMART_TABLES["nvme"].samples({
+        "Percentage used": "3%",
+        "Temperature": "31 Celsius",
+        "Power cycles": "40",
+        "Media and Data Integrity Errors": "n/a",
+    })
+
+    assert samples == [
+        ("smartmon_temperature_celsius_raw_value", 31.0),
+        ("smartmon_power_cycle_count_raw_value", 40),
+        ("smartmon_percentage_used_raw_value", 3),
+    ]
+
+def test_unknown_parser_is_rejected():
+    with pytest.raises(ValueError):
+        SmartTable("sata", [["temperature", "emp"]], [["temperature", "smartmon_temperature_celsius_raw_value", "float"]])
+
+def test_invalid_media_types_are_skipped(caplog):
+    with caplog.at_level(logging.ERROR):
+        tables = build_smart_tables({
+            "SATA": {"match": [["temperature", "emp"]], "metrics": [["temperature", "smartmon_temperature_celsius_raw_value", "digits"]]},
+            "no_metrics": {"match": []},
+            "bad_pattern": {"match": [["temperature", "("]], "metrics": []},
+        })
+
+    assert list(tables) == ["sata"]
+    assert tables["sata"].info_host
+    assert len(caplog.records) == 2
@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+class TopologyEntry(object):
+
+    def __init__(self, drives, built_at):
+        # list of (drive url, lower case media type) in walk order
+        self.drives = drives
+        self.built_at = built_at
+
+class TopologyIndex(object):
+    """
+    The drive URLs and media types of every target, so a scrape can fetch
+    the drives without walking the storage collections first.
+
+    An entry is rebuilt when it is older than ttl seconds or when one of its
+    drives is not found any more. If a directory is configured the entries
+    are saved there and survive a restart of the exporter.
+    """
+
+    def __init__(self, ttl, directory=None):
+        self.ttl = ttl
+        self.directory = directory
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _filename(self, target):
+        return os.path.join(self.directory, "topology_%s.json" % re.sub(r"[^A-Za-z0-9_.-]", "_", target))
+
+    def _load(self, target):
+        try:
+            with open(self._filename(target), "r", encoding="utf8") as topology_file:
+                data = json.load(topology_file)
+            return TopologyEntry([tuple(drive) for drive in data["drives"]], data["built_at"])
+
+        except FileNotFoundError:
+            return None
+
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            logging.warning("Target %s: Could not load the topology index: %s", target, err)
+            return None
+
+    def _save(self, target, entry):
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, prefix=".topology_")
+        try:
+            with os.fdopen(fd, "w", encoding="utf8") as topology_file:
+                json.dump({"target": target, "built_at": entry.built_at, "drives": entry.drives}, topology_file)
+            os.replace(tmp_name, self._filename(target))
+
+        except OSError as err:
+            logging.warning("Target %s: Could not save the topology index: %s", target, err)
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+
+    def get(self, target):
+        """
+        Return the indexed drives of the target, or None if the target has to
+        be walked.
+        """
+        with self._lock:
+            entry = self._entries.get(target)
+
+        if entry is None and self.directory:
+            entry = self._load(target)
+            if entry:
+                with self._lock:
+                    self._entries.setdefault(target, entry)
+
+        if entry is None:
+            return None
+
+        if time.time() - entry.built_at > self.ttl:
+            logging.debug("Target %s: Topology index is older than %s seconds", target, self.ttl)
+            return None
+
+        return entry.drives
+
+    def store(self, target, drives):
+        entry = TopologyEntry(drives, time.time())
+        with self._lock:
+            self._entries[target] = entry
+
+        logging.debug("Target %s: Indexed %s drives", target, len(drives))
+        if self.directory:
+            self._save(target, entry)
+
+    def invalidate(self, target):
+        with self._lock:
+            self._entries.pop(target, None)
+
+        if self.directory:
+            try:
+                os.unlink(self._filename(target))
+            except FileNotFoundError:
+                pass
+
+_topology_index = None
+_topology_index_lock = threading.Lock()
+
+def get_topology_index(config):
+    """
+    Return the process wide topology index, or None if it is disabled.
+    """
+    global _topology_index
+
+    topology_config = config.get("topology") or {}
+    if not topology_config.get("enabled", False):
+        return None
+
+    with _topology_index_lock:
+        if _topology_index is None:
+            directory = os.getenv("TOPOLOGY_DIR", topology_config.get("directory")) or None
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            _topology_index = TopologyIndex(
+                ttl = int(os.getenv("TOPOLOGY_TTL", topology_config.get("ttl", 3600))),
+                directory = directory
+            )
+
+    return _topology_index
@@ -0,0 +1,391 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import itertools
+import logging
+
+from expand_query import UNSUPPORTED_CODES
+
+class StorageTreeWalker(object):
+    """
+    Walk StorageServices -> StoragePools -> CapacitySources -> ProvidingDrives
+    level by level, fetching the sibling members of each level in parallel.
+
+    The members of every level are kept in the order of their parents, so the
+    drives are yielded in the same order as the serial depth-first walk. The
+    drives are yielded as they are fetched, at most max_workers of them are
+    fetched ahead, so the payloads of all drives are never held at once.
+
+    With a topology index the collections are only walked if the target is
+    not indexed yet, its entry expired or one of its drives is gone.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __init__(self, redfish_metrics_collector, max_workers):
+        self.col = redfish_metrics_collector
+        self.max_workers = max(1, int(max_workers))
+        self._executor = None
+
+        # False if a resource of the walk could not be fetched
+        self.complete = True
+
+        # the drive URLs already yielded, a fallback walk skips them
+        self.yielded = set()
+        # lower case media type by drive URL, for the topology index
+        self.media_types = {}
+        # set if an indexed drive is gone or the BMC did not expand a query
+        self.index_missing = False
+        self.expand_failed = False
+        # the drive URLs of the expanded storage pools
+        self.expanded_drive_urls = []
+
+    def executor(self):
+        if not self._executor:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix=f"walk-{self.col.target}"
+            )
+
+        return self._executor
+
+    def fetch_all(self, urls):
+        if not urls:
+            return []
+
+        if self.max_workers == 1 or len(urls) == 1:
+            return self.checked([self.col.connect_server(url) for url in urls])
+
+        return self.checked(list(self.executor().map(self.col.connect_server, urls)))
+
+    def fetch_iter(self, urls):
+        """
+        Yield the responses of the urls in their order, with at most
+        max_workers requests in flight or done but not consumed yet.
+        """
+        if self.max_workers == 1 or len(urls) <= 1:
+            for url in urls:
+                yield self.checked([self.col.connect_server(url)])[0]
+            return
+
+        urls = iter(urls)
+        pending = deque(self.executor().submit(self.col.connect_server, url) for url in itertools.islice(urls, self.max_workers))
+        while pending:
+            response = pending.popleft().result()
+            for url in itertools.islice(urls, 1):
+                pending.append(self.executor().submit(self.col.connect_server, url))
+            yield self.checked([response])[0]
+
+    def checked(self, responses):
+        if not all(isinstance(response, dict) for response in responses):
+            self.complete = False
+        return responses
+
+    @staticmethod
+    def no_response(response):
+        return isinstance(response, int) and response not in (200, 201)
+
+    @staticmethod
+    def member_urls(collection):
+        if not isinstance(collection, dict) or 'Members' not in collection:
+            return []
+
+        return [url for member in collection["Members"] for url in member.values()]
+
+    def storage_urls(self, storage_services_collection):
+        storage_urls = []
+        for storage_url in self.member_urls(storage_services_collection):
+            logging.debug("Target %s: Processing storage service: %s", self.col.target, storage_url)
+            if storage_url.split("/")[-1].startswith("lustre-") or not storage_url.startswith("/redfish/v1/"):
+                logging.debug("Target %s: Skipping storage service: %s", self.col.target, storage_url)
+                continue
+            storage_urls.append(storage_url)
+
+        return storage_urls
+
+    def pool_collection_urls(self, storage_services):
+        pool_collection_urls = []
+        for storage_service in storage_services:
+            if self.no_response(storage_service):
+                logging.info("No response from Storage service endpoint")
+                continue
+            elif storage_service is not None and 'StoragePools' in storage_service:
+                pool_collection_urls.append(storage_service["StoragePools"]['@odata.id'])
+                logging.debug("Target %s: Found storage pools endpoint", self.col.target)
+            else:
+                logging.info("StoragePools endpoint does not exist")
+
+        return pool_collection_urls
+
+    def pool_urls(self, storage_pool_collections):
+        pool_urls = []
+        for storage_pool_collection in storage_pool_collections:
+            for pool_url in self.member_urls(storage_pool_collection):
+                logging.debug("Target %s: Processing storage pool: %s", self.col.target, pool_url)
+                if not pool_url.startswith("/redfish/v1/") or pool_url.endswith("NULL"):
+                    logging.debug("Target %s: Skipping invalid pool URL: %s", self.col.target, pool_url)
+                    continue
+                pool_urls.append(pool_url)
+
+        return pool_urls
+
+    def capacity_collection_urls(self, pool_urls, storage_pools):
+        capacity_collection_urls = []
+        for pool_url, storage_pool in zip(pool_urls, storage_pools):
+            if self.no_response(storage_pool):
+                logging.debug("Target %s: No response from Storage pool endpoint: %s", self.col.target, pool_url)
+                continue
+            elif storage_pool is not None and 'CapacitySources' in storage_pool:
+                capacity_url = f"{storage_pool['@odata.id']}/CapacitySources"
+                logging.debug("Target %s: Found CapacitySources endpoint: %s", self.col.target, capacity_url)
+                capacity_collection_urls.append(capacity_url)
+            else:
+                logging.debug("Target %s: CapacitySources endpoint does not exist for pool %s", self.col.target, pool_url)
+
+        return capacity_collection_urls
+
+    def capacity_urls(self, capacity_source_collections):
+        capacity_urls = []
+        for capacity_source_collection in capacity_source_collections:
+            for capacity_url in self.member_urls(capacity_source_collection):
+                logging.debug("Target %s: Processing capacity source: %s", self.col.target, capacity_url)
+                if not capacity_url.startswith("/redfish/v1/") or capacity_url.endswith("NULL"):
+                    logging.debug("Target %s: Skipping invalid capacity URL: %s", self.col.target, capacity_url)
+                    continue
+                capacity_urls.append(capacity_url)
+
+        return capacity_urls
+
+    def drives_collection_urls(self, capacity_urls, capacity_sources):
+        drives_collection_urls = []
+        for capacity_url, capacity_source in zip(capacity_urls, capacity_sources):
+            if self.no_response(capacity_source):
+                logging.debug("Target %s: No response from Capacity source endpoint: %s", self.col.target, capacity_url)
+                continue
+            elif capacity_source is not None and 'ProvidingDrives' in capacity_source:
+                drives_url = f"{capacity_source['@odata.id']}/ProvidingDrives"
+                logging.debug("Target %s: Found ProvidingDrives endpoint: %s", self.col.target, drives_url)
+                drives_collection_urls.append(drives_url)
+            else:
+                logging.debug("Target %s: ProvidingDrives endpoint does not exist for capacity %s", self.col.target, capacity_url)
+
+        return drives_collection_urls
+
+    def drive_urls(self, providing_drives_collections):
+        drive_urls = []
+        for providing_drives_collection in providing_drives_collections:
+            for drives_url in self.member_urls(providing_drives_collection):
+                logging.debug("Target %s: Processing drive: %s", self.col.target, drives_url)
+                if not drives_url.startswith("/redfish/v1") or drives_url.endswith("NULL"):
+                    logging.debug("Target %s: Skipping invalid drive URL: %s", self.col.target, drives_url)
+                    continue
+                drive_urls.append(drives_url)
+
+        return drive_urls
+
+    def drive(self, drives_url, providing_drives):
+        """
+        Return the drive resource of a response, or None if it is no drive.
+        """
+        if isinstance(providing_drives, dict):
+            self.media_types[drives_url] = str(providing_drives.get("MediaType", "")).lower()
+
+        if self.no_response(providing_drives):
+            logging.debug("Target %s: No response from Providing Drives endpoint: %s", self.col.target, drives_url)
+        elif providing_drives is not None and "@odata.id" in providing_drives:
+            self.yielded.add(drives_url)
+            return providing_drives
+        else:
+            logging.debug("Target %s: Invalid drive data received from: %s", self.col.target, drives_url)
+
+        return None
+
+    def fetch_drives(self, drive_urls, stop_on_missing=False):
+        """
+        Yield the drives of the URLs that were not yielded yet as they are
+        fetched. With stop_on_missing, a drive that is not found any more
+        sets index_missing and ends the fetch.
+        """
+        drive_urls = [url for url in drive_urls if url not in self.yielded]
+        responses = self.fetch_iter(drive_urls)
+        for drives_url, providing_drives in zip(drive_urls, responses):
+            if stop_on_missing and providing_drives == 404:
+                self.index_missing = True
+                responses.close()
+                return
+
+            providing_drives = self.drive(drives_url, providing_drives)
+            if providing_drives is not None:
+                yield providing_drives
+
+    def has_members(self, storage_services_collection):
+        logging.debug("Target %s: Retrieved storage services collection", self.col.target)
+        if not isinstance(storage_services_collection, dict) or 'Members' not in storage_services_collection:
+            logging.debug("Target %s: No storage services members found", self.col.target)
+            return False
+
+        return True
+
+    def indexed_drive_urls(self, topology_index, media_types):
+        if not topology_index:
+            return None
+
+        indexed_drives = topology_index.get(self.col.target)
+        if indexed_drives is None:
+            return None
+
+        logging.debug("Target %s: Using the topology index", self.col.target)
+        return [url for url, media_type in indexed_drives if media_types is None or media_type in media_types]
+
+    def index_outdated(self, topology_index):
+        if not self.index_missing:
+            return False
+
+        logging.info("Target %s: Indexed drive not found, walking the storage services again", self.col.target)
+        topology_index.invalidate(self.col.target)
+        self.col.invalidate_cached_resources()
+        self.complete = True
+        return True
+
+    def update_index(self, topology_index, drive_urls):
+        # a partial walk is not indexed, the next scrape walks the collections again
+        if not topology_index or not drive_urls or not self.complete:
+            return
+
+        topology_index.store(self.col.target, [
+            (drive_url, self.media_types.get(drive_url, "")) for drive_url in drive_urls
+        ])
+
+    def expand_capabilities(self):
+        expand_query = self.col.expand_query
+        if not expand_query or not self.col.expand_capabilities or not expand_query.usable(self.col.target):
+            return None
+
+        return self.col.expand_capabilities
+
+    def record_strategy(self, strategy):
+        if self.col.expand_query:
+            self.col.expand_query.record(self.col.target, strategy)
+
+    def expanded_drives(self, capacity_collection_url, expanded_collection):
+        """
+        Return the drive URLs and the drives or drive URLs to fetch of an
+        expanded capacity source collection, or None if the BMC did not
+        expand it.
+        """
+        drive_urls = []
+        drives = []
+        if self.no_response(expanded_collection) and expanded_collection in UNSUPPORTED_CODES:
+            self.col.expand_query.unsupported(self.col.target, f"HTTP {expanded_collection}")
+            return None
+        elif not isinstance(expanded_collection, dict):
+            logging.debug("Target %s: No response from expanded capacity sources: %s", self.col.target, capacity_collection_url)
+            return drive_urls, drives
+
+        for capacity_source in expanded_collection.get("Members", []):
+            if not isinstance(capacity_source, dict) or "ProvidingDrives" not in capacity_source:
+                if isinstance(capacity_source, dict) and len(capacity_source) == 1:
+                    self.col.expand_query.unsupported(self.col.target, "capacity sources not expanded")
+                    return None
+                logging.debug("Target %s: ProvidingDrives endpoint does not exist for capacity source", self.col.target)
+                continue
+
+            # the members of an expanded collection or the inlined drive links
+            providing_drives = capacity_source["ProvidingDrives"]
+            if isinstance(providing_drives, dict):
+                if "Members" not in providing_drives:
+                    self.col.expand_query.unsupported(self.col.target, "providing drives not expanded")
+                    return None
+                providing_drives = providing_drives["Members"]
+
+            for drive in providing_drives:
+                drive_url = drive.get("@odata.id", "") if isinstance(drive, dict) else ""
+                if not drive_url.startswith("/redfish/v1") or drive_url.endswith("NULL"):
+                    logging.debug("Target %s: Skipping invalid drive URL: %s", self.col.target, drive_url)
+                    continue
+
+                drive_urls.append(drive_url)
+                # drives that are only linked are fetched on their own
+                drives.append(self.col.select_fields("drive", drive) if len(drive) > 1 else drive_url)
+
+        return drive_urls, drives
+
+    def expand_walk(self, capabilities, storage_services_url):
+        """
+        Yield the drives below the storage services collection fetched with
+        one expand query per storage pool. If the BMC does not expand a query,
+        expand_failed is set and the drives that were not yielded yet have to
+        be walked.
+        """
+        pool_urls = self.discover_pool_urls(storage_services_url)
+        capacity_collection_urls = self.capacity_collection_urls(pool_urls, self.fetch_all(pool_urls))
+        expanded_collections = self.fetch_iter([
+            self.col.expand_query.url(url, capabilities) for url in capacity_collection_urls
+        ])
+
+        for capacity_collection_url, expanded_collection in zip(capacity_collection_urls, expanded_collections):
+            expanded = self.expanded_drives(capacity_collection_url, expanded_collection)
+            if expanded is None:
+                expanded_collections.close()
+                self.expand_failed = True
+                self.complete = True
+                return
+
+            drive_urls, drives = expanded
+            self.expanded_drive_urls.extend(drive_urls)
+            linked = self.fetch_iter([drive for drive in drives if isinstance(drive, str)])
+            for drive_url, drive in zip(drive_urls, drives):
+                providing_drives = self.drive(drive_url, next(linked) if isinstance(drive, str) else drive)
+                if providing_drives is not None:
+                    yield providing_drives
+
+    def discover_pool_urls(self, storage_services_url):
+        storage_services_collection = self.checked([self.col.connect_server(storage_services_url)])[0]
+        if not self.has_members(storage_services_collection):
+            return []
+
+        storage_urls = self.storage_urls(storage_services_collection)
+        pool_collection_urls = self.pool_collection_urls(self.fetch_all(storage_urls))
+        return self.pool_urls(self.fetch_all(pool_collection_urls))
+
+    def discover_drive_urls(self, storage_services_url):
+        pool_urls = self.discover_pool_urls(storage_services_url)
+        capacity_collection_urls = self.capacity_collection_urls(pool_urls, self.fetch_all(pool_urls))
+        capacity_urls = self.capacity_urls(self.fetch_all(capacity_collection_urls))
+        drives_collection_urls = self.drives_collection_urls(capacity_urls, self.fetch_all(capacity_urls))
+
+        return self.drive_urls(self.fetch_all(drives_collection_urls))
+
+    def walk(self, storage_services_url, topology_index=None, media_types=None):
+        """
+        Yield the drive resources below the storage services collection.
+
+        Drives of other media types than media_types are left out if they are
+        known from the topology index. A BMC supporting the expand query
+        returns the drives of a storage pool in one response instead.
+        """
+        capabilities = self.expand_capabilities()
+        if capabilities:
+            yield from self.expand_walk(capabilities, storage_services_url)
+            if not self.expand_failed:
+                self.record_strategy("expand")
+                self.update_index(topology_index, self.expanded_drive_urls)
+                return
+
+        drive_urls = self.indexed_drive_urls(topology_index, media_types)
+        if drive_urls is not None:
+            yield from self.fetch_drives(drive_urls, stop_on_missing=True)
+            if not self.index_outdated(topology_index):
+                self.record_strategy("index")
+                return
+
+        self.record_strategy("walk")
+        drive_urls = self.discover_drive_urls(storage_services_url)
+        yield from self.fetch_drives(drive_urls)
+        self.update_index(topology_index, drive_urls)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None